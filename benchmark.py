@@ -0,0 +1,204 @@
+"""Benchmarks of data pipeline components on synthetic data."""
+
+from argparse import ArgumentParser
+from utils.gvar import grayscale_variation, grayscale_variation_sequence
+from utils.load_utils import normalize, normalize_sequence
+from utils.codecs import CompactCodec, CompressedCodec
+from utils.resize import resize_sequence
+from utils.decode import DECODERS
+from utils.augment import rotate_joints, apply_augs
+from utils.batch_augment import apply_batch_augs
+import torch
+import cv2
+from PIL import Image
+import numpy as np
+import tempfile
+import time
+import os
+
+
+GVAR = {"eta": 10, "g_min": 155, "g_max": 255, "near_depth_thresh": 200}
+
+
+def synthetic_depth(T: int, H: int, W: int, rng: np.random.Generator) -> np.ndarray:
+    """Cropped hand-like depth sequence: a slowly moving, noisy blob in front of a zero background.
+
+    Args:
+        T (int): Number of frames.
+        H (int): Frame height.
+        W (int): Frame width.
+        rng (np.random.Generator): Random generator.
+
+    Returns:
+        np.ndarray: uint16 depth frames of shape (T, 1, H, W).
+    """
+
+    y, x = np.mgrid[:H, :W] / np.array([H, W]).reshape(2, 1, 1)
+    cy, cx = 0.5 + 0.1 * np.cumsum(rng.normal(0, 0.05, (2, T)), axis=1)
+
+    r = ((y[None] - cy[:, None, None]) / 0.3) ** 2 + ((x[None] - cx[:, None, None]) / 0.2) ** 2
+    depth = np.where(r < 1, 400 + 150 * r + rng.normal(0, 3, (T, H, W)), 0)
+    return depth.clip(0, None).astype(np.uint16)[:, None]
+
+
+def time_per_call(fn, *args, repeat: int = 5) -> float:
+    """Best wall time of fn(*args) over repeat runs, in ms."""
+
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return 1e3 * best
+
+
+def bench_codecs(args):
+    """Memory vs. decode time of the cache codecs, for gvar frames and normalized (vanilla) frames."""
+
+    rng = np.random.default_rng(0)
+
+    for name, res, quantize in [("gvar", 50, lambda s: grayscale_variation_sequence(s, **GVAR)), ("vanilla", 227, normalize_sequence)]:
+        sequences = [quantize(synthetic_depth(args.T, res, res, rng)) for _ in range(args.n)]
+        raw_bytes = sum(s.nbytes for s in sequences)
+
+        codecs = {
+            "zlib": CompressedCodec("zlib", (1, res, res), np.uint8),
+            "delta": CompressedCodec("delta", (1, res, res), np.uint8)
+        }
+        if name == "gvar":
+            codecs = dict(compact=CompactCodec(GVAR, res), **codecs)
+
+        print(f"\n{name} frames, {args.n} sequences of shape {sequences[0].shape}, {raw_bytes / 2**20:.1f} MiB uncompressed")
+        print(f"{'codec':>8} | {'ratio':>6} | {'encode ms/seq':>13} | {'decode ms/seq':>13}")
+
+        for codec_name, codec in codecs.items():
+            encoded = [codec.encode_image(s) for s in sequences]
+            assert all(np.array_equal(codec.decode_image(e), s) for e, s in zip(encoded, sequences))
+
+            nbytes = sum(len(e) if isinstance(e, bytes) else e.nbytes for e in encoded)
+            encode_ms = time_per_call(lambda: [codec.encode_image(s) for s in sequences]) / args.n
+            decode_ms = time_per_call(lambda: [codec.decode_image(e) for e in encoded]) / args.n
+            print(f"{codec_name:>8} | {raw_bytes / nbytes:>6.2f} | {encode_ms:>13.3f} | {decode_ms:>13.3f}")
+
+
+def bench_gvar(args):
+    """Per-frame vs. whole-sequence quantization of resized depth frames."""
+
+    rng = np.random.default_rng(0)
+
+    print(f"{'res':>5} | {'method':>7} | {'per-frame ms/seq':>16} | {'sequence ms/seq':>15}")
+    for res in [50, 112, 227]:
+        depth = synthetic_depth(args.T, res, res, rng)
+        out = np.empty(depth.shape, dtype=np.uint8)
+
+        for name, per_frame, per_sequence in [
+            ("gvar", lambda: [grayscale_variation(f[0], **GVAR) for f in depth], lambda: grayscale_variation_sequence(depth, **GVAR, out=out)),
+            ("norm", lambda: [normalize(f[0]) for f in depth], lambda: normalize_sequence(depth, out=out))
+        ]:
+            assert np.array_equal(np.stack(per_frame())[:, None], per_sequence())
+            print(f"{res:>5} | {name:>7} | {time_per_call(per_frame):>16.3f} | {time_per_call(per_sequence):>15.3f}")
+
+
+def bench_resize(args):
+    """PIL Lanczos per frame vs. batched resize_sequence of full 480x640 depth frames."""
+
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 3000, (args.T, 480, 640)).astype(np.uint16)
+    images = [Image.fromarray(frame) for frame in frames]
+
+    print(f"{'res':>5} | {'PIL ms/seq':>10} | {'float32 ms/seq':>14} | {'float64 ms/seq':>14} | {'max diff':>8} | {'pixels differing':>16}")
+    for res in [50, 112, 227]:
+        reference = np.stack([np.array(image.resize((res, res), Image.LANCZOS)) for image in images])
+        diff = np.abs(reference.astype(np.int32) - resize_sequence(frames, res, res))
+
+        pil_ms = time_per_call(lambda: [image.resize((res, res), Image.LANCZOS) for image in images])
+        f32_ms = time_per_call(resize_sequence, frames, res, res)
+        f64_ms = time_per_call(lambda: resize_sequence(frames, res, res, dtype=np.float64))
+        print(f"{res:>5} | {pil_ms:>10.3f} | {f32_ms:>14.3f} | {f64_ms:>14.3f} | {diff.max():>8} | {(diff > 0).mean():>16.2e}")
+
+
+def bench_decode(args):
+    """Frames/s of each frame decoder (exp.decoder) on full 480x640 16-bit depth frames written to a temporary directory."""
+
+    rng = np.random.default_rng(0)
+    frames = synthetic_depth(args.n, 480, 640, rng)[:, 0]
+
+    print(f"{'decoder':>8} | {'frames/s':>9} | {'MiB/frame':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, decoder in DECODERS.items():
+            paths = [os.path.join(tmp_dir, f"{name}_{i}{decoder.ext}") for i in range(args.n)]
+            for path, frame in zip(paths, frames):
+                decoder.write(path, frame)
+
+            assert all(np.array_equal(decoder.read(path), frame) for path, frame in zip(paths, frames))
+
+            ms = time_per_call(lambda: [decoder.read(path) for path in paths])
+            mib = sum(os.path.getsize(path) for path in paths) / args.n / 2**20
+            print(f"{name:>8} | {1e3 * args.n / ms:>9.1f} | {mib:>9.3f}")
+
+
+def rotate_joints_per_frame(joint_points: np.ndarray, rot_angle: float, palm_idx: int = 1) -> np.ndarray:
+    """Former frame-by-frame rotation of the augmentations, for reference."""
+
+    num_frames = joint_points.shape[0]
+    joint_points = joint_points.reshape(num_frames, 22, -1).copy()
+
+    for i in range(num_frames):
+        center = joint_points[i, palm_idx, :2]
+        rot_mat = cv2.getRotationMatrix2D(center, rot_angle, 1)
+        joint_points[i] = np.hstack([joint_points[i], np.ones((22, 1))]) @ rot_mat.T
+
+    return joint_points.reshape(num_frames, -1)
+
+
+def bench_joints(args):
+    """Frame-by-frame vs. vectorised rotation of 2D joint points."""
+
+    rng = np.random.default_rng(0)
+    joint_points = [rng.uniform(-200, 200, (args.T, 44)).astype(np.float32) for _ in range(args.n)]
+
+    max_diff = max(np.abs(rotate_joints(j, 17) - rotate_joints_per_frame(j, 17)).max() for j in joint_points)
+    assert max_diff < 1e-3, f"Vectorised rotation deviates by {max_diff}."
+
+    loop_ms = time_per_call(lambda: [rotate_joints_per_frame(j, 17) for j in joint_points]) / args.n
+    vec_ms = time_per_call(lambda: [rotate_joints(j, 17) for j in joint_points]) / args.n
+    print(f"per-frame: {loop_ms:.3f} ms/seq | vectorised: {vec_ms:.3f} ms/seq | max abs diff: {max_diff:.2e}")
+
+
+def bench_batch_aug(args):
+    """Per-sample augmentation as in the loader workers vs. one call on the collated batch."""
+
+    rng = np.random.default_rng(0)
+    augs = {
+        "shift_scale_rotate": {"shift_limit": 0.2, "scale_limit": 0.2, "rotate_limit": 20, "p": 1.0},
+        "time_shift": {"frame_limit": 3, "p": 0.5}
+    }
+
+    images = [synthetic_depth(args.T, 50, 50, rng).astype(np.float32) / 255 for _ in range(args.n)]
+    joints = [rng.uniform(-1, 1, (args.T, 44)).astype(np.float32) for _ in range(args.n)]
+    batch_joints, batch_images = torch.from_numpy(np.stack(joints)), torch.from_numpy(np.stack(images))
+
+    sample_ms = time_per_call(lambda: [apply_augs(j.copy(), i.copy(), augs) for j, i in zip(joints, images)]) / args.n
+    batch_ms = time_per_call(lambda: apply_batch_augs(batch_joints, batch_images, augs)) / args.n
+    print(f"per-sample: {sample_ms:.3f} ms/seq | batched ({torch.get_num_threads()} threads): {batch_ms:.3f} ms/seq")
+
+
+BENCHMARKS = {
+    "codecs": bench_codecs,
+    "gvar": bench_gvar,
+    "resize": bench_resize,
+    "decode": bench_decode,
+    "joints": bench_joints,
+    "batch_aug": bench_batch_aug
+}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--bench", type=str, nargs="+", default=list(BENCHMARKS), help=f"Benchmarks to run, of {list(BENCHMARKS)}.")
+    parser.add_argument("--n", type=int, default=32, help="Number of synthetic sequences.")
+    parser.add_argument("--T", type=int, default=32, help="Sequence length.")
+    args = parser.parse_args()
+
+    for bench in args.bench:
+        BENCHMARKS[bench](args)
@@ -1,16 +1,60 @@
-"""Crops hand region of interest (ROI) from video frames."""
+"""Crops hand region of interest (ROI) from video frames.
+
+With --conf, frames are also resized and quantized as specified by the config's transforms.preprocess section,
+so that training reads ready-to-use uint8 frames (set preprocess.offline to the chosen --format).
+"""
 
 from argparse import ArgumentParser
+from config_parser import get_config
+from utils.load_utils import preprocess_image
+from utils.decode import get_decoder, frame_path
 import numpy as np
-from PIL import Image
 import multiprocessing as mp
+import functools
 import os
 import glob
 import shutil
 import time
+import yaml
+
+
+def frame_name(i: int, mode: str) -> str:
+    """File name of the i-th frame of a sequence."""
+
+    if mode == "shrec":
+        return f"{i}_depth.png"
+    elif mode == "dhg":
+        return f"depth_{i+1}.png"
+
+
+def crop(i: int, data_dir: str, roi: np.ndarray, mode: str, preprocess_dict: dict = None, decoder: str = "pil") -> np.ndarray:
+    """Crops ROI from frame, optionally followed by resizing and quantization.
 
+    Args:
+        i (int): Frame id.
+        data_dir (str): Path to directory containing frames of a particular data item.
+        roi (np.ndarray): Region of interest, array of shape (4,) containing x, y, w, h.
+        mode (str): One of 'shrec' or 'dhg'.
+        preprocess_dict (dict, optional): Dict containing preprocess specifications. Defaults to None.
+        decoder (str, optional): Decoder of the input frames, see utils.decode. Defaults to 'pil'.
+
+    Returns:
+        np.ndarray: Cropped frame; uint8 frame of shape (H_new, W_new) if preprocess_dict is given.
+    """
 
-def crop_and_save(i: int, data_dir: str, out_dir: str, roi: np.ndarray, mode: str) -> None:
+    x, y, w, h = roi
+
+    decoder = get_decoder(decoder)
+    image = decoder.read(frame_path(os.path.join(data_dir, frame_name(i, mode)), decoder))
+    image = image[y: y + h, x: x + w]
+
+    if preprocess_dict is not None:
+        image = preprocess_image(np.ascontiguousarray(image), preprocess_dict)
+
+    return image
+
+
+def crop_and_save(i: int, data_dir: str, out_dir: str, roi: np.ndarray, mode: str, preprocess_dict: dict = None, decoder: str = "pil", out_decoder: str = None) -> None:
     """Crops ROI from frame and saves it to some specified location.
 
     Args:
@@ -19,25 +63,40 @@ def crop_and_save(i: int, data_dir: str, out_dir: str, roi: np.ndarray, mode: st
         out_dir (str): Path to output directory which will contain cropped frames.
         roi (np.ndarray): Region of interest, array of shape (4,) containing x, y, w, h.
         mode (str): One of 'shrec' or 'dhg'.
+        preprocess_dict (dict, optional): Dict containing preprocess specifications. Defaults to None.
+        decoder (str, optional): Decoder of the input frames, see utils.decode. Defaults to 'pil'.
+        out_decoder (str, optional): Decoder that reads the output frames, e.g. 'npy'. Defaults to decoder.
     """
 
-    x, y, w, h = roi
+    image = crop(i, data_dir, roi, mode, preprocess_dict, decoder)
 
-    if mode == "shrec":
-        file_name = f"{i}_depth.png"
-    elif mode == "dhg":
-        file_name = f"depth_{i+1}.png"
+    out_decoder = get_decoder(out_decoder or decoder)
+    out_decoder.write(frame_path(os.path.join(out_dir, frame_name(i, mode)), out_decoder), image)
 
-    image_path = os.path.join(data_dir, file_name)
-    out_path = os.path.join(out_dir, file_name)
 
-    image = np.array(Image.open(image_path))
-    image = image[y: y + h, x: x + w]
-    Image.fromarray(image).save(out_path)
+def crop_sequence_and_save(data_dir: str, out_dir: str, rois: np.ndarray, mode: str, preprocess_dict: dict, decoder: str = "pil") -> None:
+    """Crops, resizes and quantizes all frames of a data item and saves them as a single frames.npy array.
+
+    Args:
+        data_dir (str): Path to directory containing frames of a particular data item.
+        out_dir (str): Path to output directory.
+        rois (np.ndarray): Regions of interest, array of shape (num_frames, 4).
+        mode (str): One of 'shrec' or 'dhg'.
+        preprocess_dict (dict): Dict containing preprocess specifications.
+        decoder (str, optional): Decoder of the input frames, see utils.decode. Defaults to 'pil'.
+    """
 
+    H_new, W_new = preprocess_dict["resize"]["H_new"], preprocess_dict["resize"]["W_new"]
+    frames = np.zeros((rois.shape[0], H_new, W_new), dtype=np.uint8)
 
-def data_loc_generator(data_root: str, out_root: str, mode: str):
-    """Creates subdirectories, transfers metadata and generates roi.
+    for i in range(rois.shape[0]):
+        frames[i] = crop(i, data_dir, rois[i], mode, preprocess_dict, decoder)
+
+    np.save(os.path.join(out_dir, "frames.npy"), frames)
+
+
+def sequence_loc_generator(data_root: str, out_root: str, mode: str):
+    """Creates subdirectories, transfers metadata and generates rois of each data item.
 
     Args:
         data_root (str): Base path containing full dataset.
@@ -45,10 +104,9 @@ def data_loc_generator(data_root: str, out_root: str, mode: str):
         mode (str): One of 'shrec' or 'dhg'.
 
     Yields:
-        i (int): Frame id.
         data_dir (str): Path to directory containing frames of a particular data item.
         out_dir (str): Path to output directory which will contain cropped frames.
-        (np.ndarray): Region of interest, array of shape (4,) containing x, y, w, h.
+        (np.ndarray): Regions of interest, array of shape (num_frames, 4) containing x, y, w, h.
     """
 
     if mode == "shrec":
@@ -75,20 +133,50 @@ def data_loc_generator(data_root: str, out_root: str, mode: str):
         shutil.copy2(os.path.join(data_dir, joint_2d_file), out_dir)
         shutil.copy2(os.path.join(data_dir, joint_3d_file), out_dir)
         
+        yield data_dir, out_dir, gen_info, mode
+
+
+def data_loc_generator(data_root: str, out_root: str, mode: str):
+    """Creates subdirectories, transfers metadata and generates roi.
+
+    Args:
+        data_root (str): Base path containing full dataset.
+        out_root (str): Output path for cropped dataset.
+        mode (str): One of 'shrec' or 'dhg'.
+
+    Yields:
+        i (int): Frame id.
+        data_dir (str): Path to directory containing frames of a particular data item.
+        out_dir (str): Path to output directory which will contain cropped frames.
+        (np.ndarray): Region of interest, array of shape (4,) containing x, y, w, h.
+    """
+
+    for data_dir, out_dir, gen_info, mode in sequence_loc_generator(data_root, out_root, mode):
         for i in range(gen_info.shape[0]):
             yield i, data_dir, out_dir, gen_info[i], mode
 
 
 def main(args):
+    preprocess_dict = None
+    if args.conf is not None:
+        preprocess_dict = get_config(args.conf)["hparams"]["transforms"]["preprocess"]
+        preprocess_dict = {k: v for k, v in preprocess_dict.items() if k != "offline"}
+
+    assert args.format == "png" or preprocess_dict is not None, "--format npy requires --conf."
+
     if args.p:
         pool = mp.Pool(args.p)
 
+    if args.format == "npy":
+        func, arg_generator = functools.partial(crop_sequence_and_save, decoder=args.decoder), sequence_loc_generator(args.i, args.o, args.mode)
+    else:
+        func, arg_generator = functools.partial(crop_and_save, decoder=args.decoder, out_decoder=args.out_decoder), data_loc_generator(args.i, args.o, args.mode)
 
-    for func_args in data_loc_generator(args.i, args.o, args.mode):
+    for func_args in arg_generator:
         if args.p:
-            pool.apply_async(crop_and_save, func_args)
+            pool.apply_async(func, func_args + (preprocess_dict,))
         else:
-            crop_and_save(*func_args)
+            func(*func_args, preprocess_dict)
 
 
     if args.p:
@@ -99,6 +187,11 @@ def main(args):
     for meta_file in glob.glob(os.path.join(args.i, "*.txt")):
         shutil.copy2(meta_file, args.o)
 
+    # Record the preprocessing baked into the frames
+    if preprocess_dict is not None:
+        with open(os.path.join(args.o, "preprocess.yaml"), "w") as f:
+            yaml.dump(dict(preprocess_dict, offline=args.format), f)
+
 
 if __name__ == "__main__":
     parser = ArgumentParser()
@@ -106,6 +199,10 @@ if __name__ == "__main__":
     parser.add_argument("--o", type=str, required=True, help="Data output dir.")
     parser.add_argument("--p", type=int, default=0, help="Number of worker processes.")
     parser.add_argument("--mode", type=str, required=True, help="shrec or dhg.")
+    parser.add_argument("--conf", type=str, default=None, help="Config whose transforms.preprocess is applied after cropping.")
+    parser.add_argument("--format", type=str, default="png", help="png (one file per frame) or npy (one array per data item).")
+    parser.add_argument("--decoder", type=str, default="pil", help="Decoder of the input frames: pil, cv2 or npy (.npy frames).")
+    parser.add_argument("--out_decoder", type=str, default=None, help="With --format png, decoder the output frames are written for (e.g. npy); defaults to --decoder.")
     args = parser.parse_args()
 
 
@@ -2,7 +2,7 @@ from argparse import ArgumentParser
 from config_parser import get_config
 
 from utils.trainer import evaluate_stats
-from utils.load_DHG import get_loaders, init_cache
+from utils.load_DHG import get_loaders, get_cache
 from utils.misc import seed_everything, count_params, get_model, log
 
 import torch
@@ -45,7 +45,7 @@ def eval_pipeline(config, cache = None):
     loaders = get_loaders(config, cache, eval_mode=True)
 
     # model
-    model = get_model(config["hparams"]["model"])
+    model = get_model(config["hparams"]["model"], config["hparams"]["transforms"]["preprocess"])
     print(f"Created model with {count_params(model)} parameters.")
 
     # restore ckpt
@@ -82,16 +82,7 @@ def main(args):
     
     data_list = np.loadtxt(config["data_list_path"], np.int32)
 
-    cache = None
-    if config["exp"]["cache"]:
-        cache = init_cache(
-            data_list,
-            config["data_root"],
-            config["hparams"]["model"]["T"],
-            config["hparams"]["model"]["D"],
-            config["hparams"]["transforms"]["train"],
-            config["exp"]["n_cache_workers"]
-        )
+    cache = get_cache(config, data_list)
 
     #################################
     # leave one out cross validation
@@ -1,6 +1,7 @@
 import torch
 from torch import nn
 from models.blocks import ConvBlock, MLP
+from models.preprocess import DepthPreprocess
 from einops import rearrange
 from typing import Tuple
 
@@ -8,9 +9,12 @@ from typing import Tuple
 class FeatureFusionNet(nn.Module):
     def __init__(self, conv_blocks: list = [8, 16, 32], res_in : Tuple[int, int] = (50, 50), T : int = 32, D : int = 2, num_classes : int = 14,
         drop_prb : float = 0.5, mlp_layers: list = [128], lstm_units: int = 128, lstm_layers: int = 2, use_bilstm: bool = True,
-        actn_type: str = "swish", use_bn: bool = True, use_ln: bool = False, **kwargs) -> None:
+        actn_type: str = "swish", use_bn: bool = True, use_ln: bool = False, preprocess: dict = None, **kwargs) -> None:
         super().__init__()
 
+        # quantizes raw depth input in-graph, see models.preprocess
+        self.preprocess = DepthPreprocess(preprocess) if preprocess is not None else None
+
         self.depth_cnn = nn.Sequential(*[ConvBlock(1 if not i else conv_blocks[i - 1], conv_blocks[i], 3, 1, 1, use_bn, actn_type) for i in range(len(conv_blocks))])
 
         with torch.no_grad():
@@ -29,6 +33,9 @@ class FeatureFusionNet(nn.Module):
         x_jnt = self.joint_lstm(x_jnt)[0]
 
         # depth images
+        if self.preprocess is not None:
+            x_dpt = self.preprocess(x_dpt)
+
         x_dpt = rearrange(x_dpt, "b t c h w -> (b t) c h w")
         x_dpt = self.depth_cnn(x_dpt)
         x_dpt = rearrange(x_dpt, "(b t) c h w -> b t (c h w)", t=x_jnt.shape[1])
@@ -45,9 +52,12 @@ class FeatureFusionNet(nn.Module):
 class ScoreFusionNet(nn.Module):
     def __init__(self, conv_blocks: list = [8, 16, 32], res_in : Tuple[int, int] = (50, 50), T : int = 32, D : int = 2, num_classes : int = 14,
         drop_prb : float = 0.5, mlp_layers: list = [128], lstm_units: int = 128, lstm_layers: int = 2, use_bilstm: bool = True,
-        actn_type: str = "swish", use_bn: bool = True, use_ln: bool = False, **kwargs) -> None:
+        actn_type: str = "swish", use_bn: bool = True, use_ln: bool = False, preprocess: dict = None, **kwargs) -> None:
         super().__init__()
 
+        # quantizes raw depth input in-graph, see models.preprocess
+        self.preprocess = DepthPreprocess(preprocess) if preprocess is not None else None
+
         self.depth_cnn = nn.Sequential(*[ConvBlock(1 if not i else conv_blocks[i - 1], conv_blocks[i], 3, 1, 1, use_bn, actn_type) for i in range(len(conv_blocks))])
 
         with torch.no_grad():
@@ -66,6 +76,9 @@ class ScoreFusionNet(nn.Module):
         x_jnt = self.joint_lstm(x_jnt)[0]
 
         # depth images
+        if self.preprocess is not None:
+            x_dpt = self.preprocess(x_dpt)
+
         x_dpt = rearrange(x_dpt, "b t c h w -> (b t) c h w")
         x_dpt = self.depth_cnn(x_dpt)
         x_dpt = rearrange(x_dpt, "(b t) c h w -> b t (c h w)", t=x_jnt.shape[1])
@@ -79,21 +92,37 @@ class ScoreFusionNet(nn.Module):
         return 0.5 * (x_dpt + x_jnt)
 
 
-def model_from_name(name, num_classes):
-    assert name in ["gvar_feature_fusion", "gvar_score_fusion", "vanilla_feature_fusion", "vanilla_score_fusion"]
+MODEL_RES_IN = {
+    "gvar_feature_fusion": (50, 50),
+    "gvar_score_fusion": (50, 50),
+    "vanilla_feature_fusion": (227, 227),
+    "vanilla_score_fusion": (227, 227)
+}
+
+
+def model_from_name(name, num_classes, preprocess=None):
+    assert name in MODEL_RES_IN
 
     if name == "gvar_feature_fusion":
-        model = FeatureFusionNet(num_classes=num_classes)
+        model = FeatureFusionNet(res_in=MODEL_RES_IN[name], num_classes=num_classes, preprocess=preprocess)
 
     elif name == "gvar_score_fusion":
-        model = ScoreFusionNet(num_classes=num_classes)
+        model = ScoreFusionNet(res_in=MODEL_RES_IN[name], num_classes=num_classes, preprocess=preprocess)
 
     elif name == "vanilla_feature_fusion":
-        model = FeatureFusionNet(res_in=(227,227), num_classes=num_classes, drop_prb=0.0, mlp_layers=[256,512,256], lstm_units=256,
-                    use_bilstm=False, actn_type="relu", use_bn=False)
+        model = FeatureFusionNet(res_in=MODEL_RES_IN[name], num_classes=num_classes, drop_prb=0.0, mlp_layers=[256,512,256], lstm_units=256,
+                    use_bilstm=False, actn_type="relu", use_bn=False, preprocess=preprocess)
                     
     elif name == "vanilla_score_fusion":
-        model = ScoreFusionNet(res_in=(227,227), num_classes=num_classes, drop_prb=0.0, mlp_layers=[256,512,256], lstm_units=256,
-                    use_bilstm=False, actn_type="relu", use_bn=False)
+        model = ScoreFusionNet(res_in=MODEL_RES_IN[name], num_classes=num_classes, drop_prb=0.0, mlp_layers=[256,512,256], lstm_units=256,
+                    use_bilstm=False, actn_type="relu", use_bn=False, preprocess=preprocess)
+
+    return model
+
+
+def get_res_in(model_config: dict) -> Tuple[int, int]:
+    """Input resolution (H, W) of the depth CNN of the configured model."""
 
-    return model
\ No newline at end of file
+    if model_config["name"] is not None:
+        return MODEL_RES_IN[model_config["name"]]
+    return tuple(model_config["res_in"])
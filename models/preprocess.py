@@ -0,0 +1,74 @@
+"""Depth quantization as part of the model graph."""
+
+import torch
+from torch import nn
+
+
+class DepthPreprocess(nn.Module):
+    """Torch counterpart of the gvar / normalize preprocessing in utils.load_utils.
+
+    Takes batches of resized raw depth frames, so that quantization runs batched (on the model's device or with
+    intra-op threads) instead of per sample in the loader workers, and exported models accept raw depth directly.
+    Frames are quantized independently; all-zero padding frames stay zero.
+    """
+
+    def __init__(self, preprocess_dict: dict):
+        """
+        Args:
+            preprocess_dict (dict): Dict containing preprocess specifications, as in transforms.preprocess.
+        """
+
+        super().__init__()
+
+        assert not preprocess_dict.get("offline"), "Offline preprocessed frames are already quantized."
+        self.gvar = preprocess_dict.get("gvar")
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            x (torch.Tensor): Raw depth frames of shape (B, T, 1, H, W).
+
+        Returns:
+            torch.Tensor: Quantized frames in the 0-1 range, as float32 of the same shape.
+        """
+
+        frames = x.float().flatten(2)
+
+        if self.gvar is not None:
+            frames = self.grayscale_variation(frames, **self.gvar)
+        else:
+            frames = self.normalize(frames)
+
+        return (frames / 255).view(x.shape)
+
+    @staticmethod
+    def grayscale_variation(frames: torch.Tensor, eta: int = 10, g_min: int = 155, g_max: int = 255, near_depth_thresh: int = 200) -> torch.Tensor:
+        """Quantizes depth levels of flattened frames (B, T, N) into discrete gray levels.
+
+        Identical to utils.gvar.grayscale_variation for 16-bit depth, except that eta * (image - d_min) does not
+        wrap around at 65535 like it does in uint16 arithmetic.
+        """
+
+        d_th = frames.amax(-1, keepdim=True).clamp(min=1)
+        mask = frames > near_depth_thresh
+
+        d_min = torch.where(mask, frames, torch.full_like(frames, float("inf"))).amin(-1, keepdim=True)
+        d_min = torch.where(mask.any(-1, keepdim=True), d_min, torch.zeros_like(d_min))
+
+        # frames with d_th == d_min are all zero, as 0 / 0 in the NumPy version
+        mask = mask & (d_th > d_min)
+
+        g_stride = int((g_max - g_min) / eta)
+        levels = torch.round(eta * (frames - d_min) / (d_th - d_min).clamp(min=1))  # rounds half to even, as np.round
+        return torch.where(mask, g_min + levels * g_stride, torch.zeros_like(frames))
+
+    @staticmethod
+    def normalize(frames: torch.Tensor) -> torch.Tensor:
+        """Scales flattened frames (B, T, N) to whole numbers between 0 and 255, as utils.load_utils.normalize.
+
+        Computed in float32, so values may differ by one gray level from the float64 NumPy version.
+        """
+
+        i_min, i_max = frames.amin(-1, keepdim=True), frames.amax(-1, keepdim=True)
+        denom = torch.where(i_max > i_min, i_max - i_min, torch.ones_like(i_max))
+        return torch.floor(255 * ((frames - i_min) / denom))
@@ -0,0 +1,110 @@
+"""Packs preprocessed sequences into large sharded binary files, tar shards or a multi-resolution pyramid."""
+
+from argparse import ArgumentParser
+from config_parser import get_config
+from utils.packed import PackedWriter
+from utils.load_utils import raw_depth_preprocess
+from utils.stream import TarShardWriter
+from utils.load_DHG import DHG_Dataset
+from utils.load_SHREC import SHREC_Dataset
+import numpy as np
+import multiprocessing as mp
+import functools
+from tqdm import tqdm
+import time
+import os
+
+
+def get_data_list(config: dict, mode: str) -> np.ndarray:
+    """Collects every sequence referenced by the config.
+
+    Args:
+        config (dict): Config dict.
+        mode (str): One of 'shrec' or 'dhg'.
+
+    Returns:
+        np.ndarray: Data list, without duplicates.
+    """
+
+    if mode == "shrec":
+        lists = [np.loadtxt(config["train_list_path"], np.int32), np.loadtxt(config["test_list_path"], np.int32)]
+    elif mode == "dhg":
+        lists = [np.loadtxt(config["data_list_path"], np.int32)]
+
+    data_list = np.vstack(lists)
+    _, first = np.unique(data_list, axis=0, return_index=True)
+    return data_list[np.sort(first)]
+
+
+def main(args):
+    config = get_config(args.conf)
+    T = config["hparams"]["model"]["T"]
+    D = config["hparams"]["model"]["D"]
+    transform_dict = config["hparams"]["transforms"]
+
+    data_list = get_data_list(config, args.mode)
+    dataset_cls = SHREC_Dataset if args.mode == "shrec" else DHG_Dataset
+
+    if args.format == "pyramid":
+        # frames are decoded once and resized to every level, gvar/normalize is applied per sample
+        raw_depth_preprocess(transform_dict["preprocess"])
+        levels = [[res, res] for res in args.levels]
+        transform_dict = dict(transform_dict, preprocess={"pyramid": levels, "raw_depth": True})
+
+    loader_fn = functools.partial(
+        dataset_cls.get_image_joint,
+        base_dir=config["data_root"],
+        T=T,
+        D=D,
+        transform_dict=transform_dict,
+        n_threads=config["exp"].get("n_decode_threads", 0),
+        decoder=config["exp"].get("decoder", "pil")
+    )
+
+    if args.format == "tar":
+        writer = TarShardWriter(args.o, args.shard_size << 20)
+    elif args.format == "pyramid":
+        writers = [PackedWriter(os.path.join(args.o, "{}x{}".format(*res)), args.shard_size << 20, np.uint16) for res in levels]
+    else:
+        writer = PackedWriter(args.o, args.shard_size << 20)
+
+    pool = mp.Pool(args.p) if args.p else None
+    results = pool.imap(func=loader_fn, iterable=data_list) if pool else map(loader_fn, data_list)
+
+    for data_row, (joint_points, image_sequence) in tqdm(zip(data_list, results), total=data_list.shape[0]):
+        if args.format == "pyramid":
+            for level_writer, level_sequence in zip(writers, image_sequence):
+                level_writer.add(data_row, joint_points, level_sequence)
+        else:
+            writer.add(data_row, joint_points, image_sequence)
+
+    if pool:
+        pool.close()
+        pool.join()
+
+    if args.format == "pyramid":
+        for level_writer, (H, W) in zip(writers, levels):
+            level_writer.close({"mode": args.mode, "T": T, "D": D, "preprocess": {"resize": {"H_new": H, "W_new": W}, "raw_depth": True}})
+    else:
+        writer.close({"mode": args.mode, "T": T, "D": D, "preprocess": transform_dict["preprocess"]})
+    print(f"Packed {data_list.shape[0]} sequences into {args.o}.")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--conf", type=str, required=True, help="Path to config.yaml file.")
+    parser.add_argument("--o", type=str, required=True, help="Packed data output dir.")
+    parser.add_argument("--p", type=int, default=0, help="Number of worker processes.")
+    parser.add_argument("--mode", type=str, required=True, help="shrec or dhg.")
+    parser.add_argument("--format", type=str, default="packed", help="packed (memory-mapped shards), tar (shards for streaming) or pyramid (packed raw depth at several resolutions).")
+    parser.add_argument("--levels", type=int, nargs="+", default=[227, 112, 50], help="Square resolutions stored by --format pyramid.")
+    parser.add_argument("--shard_size", type=int, default=None, help="Maximum bytes per shard, in MiB. Defaults to 16 for tar (shards are the unit of shuffling and of splitting across workers), else 1024.")
+    args = parser.parse_args()
+
+    if args.shard_size is None:
+        args.shard_size = 16 if args.format == "tar" else 1024
+
+
+    start = time.time()
+    main(args)
+    print(f"Completed in {(time.time() - start):.2f} s.")
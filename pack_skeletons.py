@@ -0,0 +1,48 @@
+"""Converts skeleton text files into indexed binary stores.
+
+Rerun after modifying any skeleton text file: the stores are used instead of the text files as long as the text files
+keep the modification times and sizes recorded here, else the text files are parsed again.
+"""
+
+from argparse import ArgumentParser
+from utils.skeletons import write_skeleton_store
+import numpy as np
+import multiprocessing as mp
+import functools
+import glob
+import os
+import time
+
+
+def main(args):
+    if args.mode == "shrec":
+        file_names = ["skeletons_image.txt", "skeletons_world.txt"]
+    elif args.mode == "dhg":
+        file_names = ["skeleton_image.txt", "skeleton_world.txt"]
+
+    seq_dirs = sorted(os.path.relpath(d, args.i) for d in glob.glob(f"{args.i}/gesture_*/finger_*/subject_*/essai_*/"))
+    pool = mp.Pool(args.p) if args.p else None
+    load_fn = functools.partial(np.loadtxt, dtype=np.float32)
+
+    for file_name in file_names:
+        paths = [os.path.join(args.i, d, file_name) for d in seq_dirs]
+        skeletons = pool.imap(load_fn, paths) if pool else map(load_fn, paths)
+        write_skeleton_store(args.i, file_name, seq_dirs, skeletons)
+        print(f"Converted {len(paths)} {file_name} files.")
+
+    if pool:
+        pool.close()
+        pool.join()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--i", type=str, required=True, help="Data dir, the stores are written here.")
+    parser.add_argument("--p", type=int, default=0, help="Number of worker processes.")
+    parser.add_argument("--mode", type=str, required=True, help="shrec or dhg.")
+    args = parser.parse_args()
+
+
+    start = time.time()
+    main(args)
+    print(f"Completed in {(time.time() - start):.2f} s.")
@@ -5,7 +5,7 @@ from utils.loss import LabelSmoothingLoss
 from utils.opt import get_optimizer
 from utils.scheduler import WarmUpLR, get_scheduler
 from utils.trainer import train
-from utils.load_DHG import get_loaders, init_cache
+from utils.load_DHG import get_loaders, get_cache
 from utils.misc import seed_everything, count_params, get_model
 
 import torch
@@ -48,7 +48,7 @@ def training_pipeline(config, cache = None):
     loaders = get_loaders(config, cache)
 
     # model
-    model = get_model(config["hparams"]["model"])
+    model = get_model(config["hparams"]["model"], config["hparams"]["transforms"]["preprocess"])
     model = model.to(config["hparams"]["device"])
     print(f"Created model with {count_params(model)} parameters.")
 
@@ -95,16 +95,7 @@ def main(args):
     
     data_list = np.loadtxt(config["data_list_path"], np.int32)
 
-    cache = None
-    if config["exp"]["cache"]:
-        cache = init_cache(
-            data_list,
-            config["data_root"],
-            config["hparams"]["model"]["T"],
-            config["hparams"]["model"]["D"],
-            config["hparams"]["transforms"],
-            config["exp"]["n_cache_workers"]
-        )
+    cache = get_cache(config, data_list)
 
     #################################
     # leave one out cross validation
@@ -46,7 +46,7 @@ def training_pipeline(config):
     loaders = get_loaders(config)
 
     # model
-    model = get_model(config["hparams"]["model"])
+    model = get_model(config["hparams"]["model"], config["hparams"]["transforms"]["preprocess"])
     model = model.to(config["hparams"]["device"])
     print(f"Created model with {count_params(model)} parameters.")
 
@@ -1,9 +1,81 @@
-import albumentations as A
 import numpy as np
 import cv2
 
 
-def joint_shift_scale_rotate(joint_points: np.ndarray, shift_limit: float, scale_limit: float, rotate_limit: int, p: float = 0.5) -> np.ndarray:
+class ScratchBuffers:
+    """Preallocated arrays reused across the items of a dataset.
+
+    Each loader worker holds its own copy of the dataset, and so its own buffers, which are allocated on first use.
+    Sequence buffers have T frames and are handed out as views of the first n frames.
+    """
+
+    def __init__(self, T: int):
+        self.T = T
+        self.buffers = {}
+
+    def get(self, name: str, shape: tuple, dtype) -> np.ndarray:
+        """View of shape (n, ...) of the sequence buffer name, reallocated if the frame shape or type changes."""
+
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape[1:] != tuple(shape[1:]) or buffer.dtype != dtype:
+            buffer = self.buffers[name] = np.empty((self.T, *shape[1:]), dtype=dtype)
+
+        return buffer[:shape[0]]
+
+    def array(self, name: str, shape: tuple, dtype) -> np.ndarray:
+        """Buffer name of exactly the given shape, reallocated if the shape or type changes."""
+
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = self.buffers[name] = np.empty(shape, dtype=dtype)
+
+        return buffer
+
+
+def rotate_joints(joint_points: np.ndarray, rot_angle: float, palm_idx: int = 1, out: np.ndarray = None, scratch: ScratchBuffers = None) -> np.ndarray:
+    """Rotates the joint points of every frame about that frame's palm point.
+
+    Equivalent to applying cv2.getRotationMatrix2D(palm, rot_angle, 1) frame by frame, done as one einsum over all
+    frames in float32. Only the first two coordinates are rotated.
+
+    Args:
+        joint_points (np.ndarray): Joint points, of shape (num_frames, 22 * D).
+        rot_angle (float): Rotation angle in degrees (counter-clockwise, as in OpenCV).
+        palm_idx (int, optional): Index of the palm joint. Defaults to 1.
+        out (np.ndarray, optional): float32 array of the same shape to write into, may be joint_points. Defaults to None.
+        scratch (ScratchBuffers, optional): Buffers for the palm points and rotated points; without them both are
+            allocated per call. Defaults to None.
+
+    Returns:
+        np.ndarray: Rotated joint points of shape (num_frames, 22 * D), of type float32.
+    """
+
+    num_frames = joint_points.shape[0]
+    if out is None:
+        out = joint_points.astype(np.float32)
+    elif out is not joint_points:
+        np.copyto(out, joint_points)
+
+    theta = np.deg2rad(rot_angle)
+    rot_mat = np.array([[np.cos(theta), np.sin(theta)], [-np.sin(theta), np.cos(theta)]], dtype=np.float32)
+
+    if scratch is None:
+        centers = np.empty((num_frames, 1, 2), dtype=np.float32)
+        rotated = np.empty((num_frames, 22, 2), dtype=np.float32)
+    else:
+        centers = scratch.get("rot_centers", (num_frames, 1, 2), np.float32)
+        rotated = scratch.get("rot_points", (num_frames, 22, 2), np.float32)
+
+    points = out.reshape(num_frames, 22, -1)[..., :2]
+    np.copyto(centers, points[:, palm_idx: palm_idx + 1])
+    points -= centers
+    np.einsum("fjk,lk->fjl", points, rot_mat, out=rotated)
+    np.add(rotated, centers, out=points)
+
+    return out
+
+
+def joint_shift_scale_rotate(joint_points: np.ndarray, shift_limit: float, scale_limit: float, rotate_limit: int, p: float = 0.5, out: np.ndarray = None, scratch: ScratchBuffers = None) -> np.ndarray:
     """Shift, scale, and rotate joint points within a specified range.
 
     Args:
@@ -12,24 +84,30 @@ def joint_shift_scale_rotate(joint_points: np.ndarray, shift_limit: float, scale
         scale_limit (float): Scale factor range.
         rotate_limit (int): Rotation range.
         p (float, optional): Probability of applying transform. Defaults to 0.5.
+        out (np.ndarray, optional): float32 array of the same shape to write into, leaving joint_points intact.
+            Defaults to None (transform in place).
+        scratch (ScratchBuffers, optional): Buffers for the rotation, see rotate_joints. Defaults to None.
 
     Returns:
-        np.ndarray: [description]
+        np.ndarray: Transformed joint points, out if given and the transform is applied.
     """
 
     if np.random.random() >= p:
         return joint_points
 
+    if out is not None:
+        np.copyto(out, joint_points)
+        joint_points = out
+
     palm_idx = 1
     num_frames = joint_points.shape[0]
     
 
     if shift_limit:
         shift = np.random.uniform(-shift_limit, shift_limit, 2)    # shift = (shift_x, shift_y)
-        joint_points = joint_points.reshape(num_frames, 22, -1)    # (num_frames, 44) -> (num_frames, 22, 2)
-        joint_points = joint_points + shift                        # shift is broadcasted and added
-        joint_points[0, palm_idx] = 0                              # joint points are supposed to be normalized relative to the palm point
-        joint_points = joint_points.reshape(num_frames, -1)        # if palm point is non-zero, cannot apply scaling
+        points = joint_points.reshape(num_frames, 22, -1)          # (num_frames, 44) -> (num_frames, 22, 2)
+        points += shift.astype(np.float32)                         # shift is broadcasted and added, in float32 to avoid a casting buffer
+        points[0, palm_idx] = 0                                    # palm relative joint points, a non-zero palm point breaks scaling
 
     if scale_limit:
         scale_factor = 1 + np.random.uniform(-scale_limit, scale_limit)
@@ -37,50 +115,110 @@ def joint_shift_scale_rotate(joint_points: np.ndarray, shift_limit: float, scale
 
     if rotate_limit:
         rot_angle = np.random.randint(-rotate_limit, rotate_limit)
-        joint_points = joint_points.reshape(num_frames, 22, -1)
-
-        for i in range(num_frames):
-            center = joint_points[i, palm_idx, :2]
-            rot_mat = cv2.getRotationMatrix2D(center, rot_angle, 1)
-            joint_points[i] = np.hstack([joint_points[i], np.ones((22, 1))]) @ rot_mat.T
-        
-        joint_points = joint_points.reshape(num_frames, -1)
+        joint_points = rotate_joints(joint_points, rot_angle, palm_idx, out=out, scratch=scratch)
 
     return joint_points
 
 
-def image_shift_scale_rotate(image_sequence: np.ndarray, shift_limit: float, scale_limit:float, rotate_limit: int, p : float = 0.5):
-    """Shift scale and rotate image within a certain limit."""
+def sample_shift_scale_rotate(shift_limit: float, scale_limit: float, rotate_limit: int, p: float = 0.5) -> dict:
+    """Samples the parameters of a shift-scale-rotate transform, like albumentations' ShiftScaleRotate.
+
+    Args:
+        shift_limit (float): Maximum shift, as a fraction of the frame size.
+        scale_limit (float): Scale factor range around 1.
+        rotate_limit (int): Rotation range in degrees.
+        p (float, optional): Probability of applying the transform. Defaults to 0.5.
+
+    Returns:
+        dict: angle (degrees), scale, dx and dy (fractions of width / height); None if the transform is not applied.
+    """
 
-    transform = A.ReplayCompose([
-        A.ShiftScaleRotate(shift_limit=shift_limit, scale_limit=scale_limit, rotate_limit=rotate_limit, p=p)
-    ])
+    if np.random.random() >= p:
+        return None
 
-    data = transform(image=image_sequence[0])
-    image_sequence[0] = data["image"]
+    return {
+        "angle": np.random.uniform(-rotate_limit, rotate_limit),
+        "scale": np.random.uniform(1 - scale_limit, 1 + scale_limit),
+        "dx": np.random.uniform(-shift_limit, shift_limit),
+        "dy": np.random.uniform(-shift_limit, shift_limit)
+    }
 
-    # Use same params for all frames
-    for i in range(1, image_sequence.shape[0]):
-        image_sequence[i] = A.ReplayCompose.replay(data['replay'], image=image_sequence[i])["image"]
 
-    return image_sequence
+def affine_matrix(params: dict, H: int, W: int) -> np.ndarray:
+    """2x3 matrix rotating and scaling about the frame center, then shifting, in pixels."""
+
+    matrix = cv2.getRotationMatrix2D(((W - 1) / 2, (H - 1) / 2), params["angle"], params["scale"])
+    matrix[0, 2] += params["dx"] * W
+    matrix[1, 2] += params["dy"] * H
+    return matrix
+
+
+CV_MAX_CHANNELS = 128  # OpenCV 5 limit of channels per image (512 in OpenCV 4)
+
+# cv2.warpAffine interpolates images of 1, 3 or 4 channels exactly like single frames. Other channel counts take
+# a different fixed-point path, which changes most pixels: by up to 7 levels on uint8 and 261 on uint16 frames.
+CV_EXACT_CHANNELS = 4
+
+
+def warp_sequence(image_sequence: np.ndarray, matrix: np.ndarray, out: np.ndarray = None, exact: bool = False, scratch: ScratchBuffers = None) -> np.ndarray:
+    """Warps all frames with the same affine matrix, passing the frames to cv2.warpAffine as channels.
+
+    Args:
+        image_sequence (np.ndarray): Frames of shape (T, 1, H, W).
+        matrix (np.ndarray): 2x3 affine matrix.
+        out (np.ndarray, optional): Array of the same shape to write into, may be image_sequence. Defaults to None.
+        exact (bool, optional): Warp CV_EXACT_CHANNELS frames per call, bit-identical to warping frame by frame
+            (see CV_EXACT_CHANNELS). About 2x slower on 50x50 frames, on par at 227x227. Defaults to False.
+        scratch (ScratchBuffers, optional): Buffers for the (H, W, C) channel chunks; without them two chunks are
+            allocated per call. Defaults to None.
+
+    Returns:
+        np.ndarray: Warped frames of shape (T, 1, H, W).
+    """
+
+    T, _, H, W = image_sequence.shape
+    if out is None:
+        out = np.empty_like(image_sequence)
+
+    # every call warps all C channels of the (H, W, C) chunk, the last chunk is padded with stale frames;
+    # with scratch buffers C only depends on the dataset's T, so they are not reallocated for shorter sequences
+    C = CV_EXACT_CHANNELS if exact else min(CV_MAX_CHANNELS, T if scratch is None else scratch.T)
+    if scratch is None:
+        channels = np.empty((H, W, C), dtype=image_sequence.dtype)
+        warped = np.empty((H, W, C), dtype=image_sequence.dtype)
+    else:
+        channels = scratch.array("warp_channels", (H, W, C), image_sequence.dtype)
+        warped = scratch.array("warp_warped", (H, W, C), image_sequence.dtype)
+
+    for start in range(0, T, C):
+        n = min(C, T - start)
+        channels[..., :n] = image_sequence[start: start + n, 0].transpose(1, 2, 0)
+        cv2.warpAffine(channels, matrix, (W, H), dst=warped, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT_101)
+        out[start: start + n, 0] = warped[..., :n].transpose(2, 0, 1)
 
+    return out
 
-def shift_scale_rotate(image_sequence: np.ndarray, joint_points: np.ndarray, shift_limit: float, scale_limit:float, rotate_limit: int, p : float = 0.5):
-    transform = A.ReplayCompose([
-        A.ShiftScaleRotate(shift_limit=shift_limit, scale_limit=scale_limit, rotate_limit=rotate_limit, p=p)
-    ])
 
-    data = transform(image=image_sequence[0])
+def image_shift_scale_rotate(image_sequence: np.ndarray, shift_limit: float, scale_limit:float, rotate_limit: int, p : float = 0.5, out: np.ndarray = None, exact: bool = False, scratch: ScratchBuffers = None):
+    """Shift scale and rotate image within a certain limit, into out if given (else in place); exact and scratch as warp_sequence."""
 
-    if not data['replay']['transforms'][0]['applied']:
+    params = sample_shift_scale_rotate(shift_limit, scale_limit, rotate_limit, p)
+    if params is None:
+        return image_sequence
+
+    # Use same params for all frames
+    return warp_sequence(image_sequence, affine_matrix(params, *image_sequence.shape[2:]), out=image_sequence if out is None else out, exact=exact, scratch=scratch)
+
+
+def shift_scale_rotate(image_sequence: np.ndarray, joint_points: np.ndarray, shift_limit: float, scale_limit:float, rotate_limit: int, p : float = 0.5, image_out: np.ndarray = None, joint_out: np.ndarray = None, exact: bool = False, scratch: ScratchBuffers = None):
+    params = sample_shift_scale_rotate(shift_limit, scale_limit, rotate_limit, p)
+
+    if params is None:
         return image_sequence, joint_points
 
-    image_sequence[0] = data["image"]
-    for i in range(1, image_sequence.shape[0]):
-        image_sequence[i] = A.ReplayCompose.replay(data['replay'], image=image_sequence[i])["image"]
+    image_sequence = warp_sequence(image_sequence, affine_matrix(params, *image_sequence.shape[2:]), out=image_sequence if image_out is None else image_out, exact=exact, scratch=scratch)
 
-    params = data['replay']['transforms'][0]['params']
+    # joints are palm relative skeleton coordinates, so they get the sampled transform rather than the pixel matrix
     rot_angle = params['angle']
     scale_factor = params['scale']
     shift = np.array([params['dx'], params['dy']])
@@ -88,24 +226,20 @@ def shift_scale_rotate(image_sequence: np.ndarray, joint_points: np.ndarray, shi
     palm_idx = 1
     num_frames = joint_points.shape[0]
     
+    if joint_out is not None:
+        np.copyto(joint_out, joint_points)
+        joint_points = joint_out
 
     if np.any(shift):
-        joint_points = joint_points.reshape(num_frames, 22, -1)    # (num_frames, 44) -> (num_frames, 22, 2)
-        joint_points = joint_points + shift                        # shift is broadcasted and added
-        joint_points[0, palm_idx] = 0                              # joint points are supposed to be normalized relative to the palm point
-        joint_points = joint_points.reshape(num_frames, -1)        # if palm point is non-zero, cannot apply scaling
+        points = joint_points.reshape(num_frames, 22, -1)          # (num_frames, 44) -> (num_frames, 22, 2)
+        points += shift.astype(np.float32)                         # shift is broadcasted and added, in float32 to avoid a casting buffer
+        points[0, palm_idx] = 0                                    # palm relative joint points, a non-zero palm point breaks scaling
 
     if scale_factor:
         joint_points *= scale_factor
 
     if rot_angle:
-        joint_points = joint_points.reshape(num_frames, 22, -1)
-        for i in range(num_frames):
-            center = joint_points[i, palm_idx, :2]
-            rot_mat = cv2.getRotationMatrix2D(center, rot_angle, 1)
-            joint_points[i] = np.hstack([joint_points[i], np.ones((22, 1))]) @ rot_mat.T
-        
-        joint_points = joint_points.reshape(num_frames, -1)
+        joint_points = rotate_joints(joint_points, rot_angle, palm_idx, out=joint_out, scratch=scratch)
 
     return image_sequence, joint_points
 
@@ -129,17 +263,30 @@ def time_shift(image_sequence, joint_points, frame_limit, p):
     return image_sequence, joint_points
 
 
-def apply_augs(joint_points, image_sequence, augs):
+def apply_augs(joint_points, image_sequence, augs, scratch: ScratchBuffers = None):
+    """Applies the augmentations in augs.
+
+    Without scratch the inputs are transformed in place. With it, transformed joints / frames are written into its
+    'joint' / 'image' buffers and the warp chunks and rotation temporaries are taken from it as well, so that the
+    inputs (e.g. cached arrays) are never modified and no sequence-sized arrays are allocated (only the sampled
+    parameters, 2x2 / 2x3 matrices and numpy's bounded broadcasting buffers are); untransformed inputs are
+    returned as they are.
+    """
+
+    joint_out = image_out = None
+    if scratch is not None:
+        joint_out = scratch.get("joint", joint_points.shape, np.float32)
+        image_out = scratch.get("image", image_sequence.shape, image_sequence.dtype)
 
     if "shift_scale_rotate" in augs:
-        image_sequence, joint_points = shift_scale_rotate(image_sequence, joint_points, **augs["shift_scale_rotate"])
+        image_sequence, joint_points = shift_scale_rotate(image_sequence, joint_points, **augs["shift_scale_rotate"], image_out=image_out, joint_out=joint_out, scratch=scratch)
     else:
         if "joint_shift_scale_rotate" in augs:
-            joint_points = joint_shift_scale_rotate(joint_points, **augs["joint_shift_scale_rotate"])
+            joint_points = joint_shift_scale_rotate(joint_points, **augs["joint_shift_scale_rotate"], out=joint_out, scratch=scratch)
 
         if "image_shift_scale_rotate" in augs:
-            image_sequence = image_shift_scale_rotate(image_sequence, **augs["image_shift_scale_rotate"])
+            image_sequence = image_shift_scale_rotate(image_sequence, **augs["image_shift_scale_rotate"], out=image_out, scratch=scratch)
     
     if "time_shift" in augs:
         image_sequence, joint_points = time_shift(image_sequence, joint_points, **augs["time_shift"])
-    return joint_points, image_sequence
\ No newline at end of file
+    return joint_points, image_sequence
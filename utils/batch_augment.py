@@ -0,0 +1,183 @@
+"""Augmentations of collated batches, the torch counterpart of utils.augment.
+
+Each sample of a batch gets its own random transform, like per-sample augmentation in the dataset, but the whole
+batch is processed by a few tensor ops on the training device (or with intra-op threads on CPU) instead of Python
+loops in the loader workers. Frames beyond a sample's length are zero padding; they are recognized by all-zero
+joints and stay zero.
+"""
+
+import torch
+import torch.nn.functional as F
+
+
+def sample_shift_scale_rotate(B: int, shift_limit: float, scale_limit: float, rotate_limit: int, p: float = 0.5, device: torch.device = None, integer_angle: bool = False, exact: bool = False) -> dict:
+    """Samples per-sample shift-scale-rotate parameters, see utils.augment.sample_shift_scale_rotate.
+
+    Zero limits give identity parameters, like the skipped steps of utils.augment.joint_shift_scale_rotate.
+
+    Args:
+        B (int): Batch size.
+        shift_limit (float): Maximum shift, as a fraction of the frame size.
+        scale_limit (float): Scale factor range around 1.
+        rotate_limit (int): Rotation range in degrees.
+        p (float, optional): Probability of applying the transform to a sample. Defaults to 0.5.
+        device (torch.device, optional): Device of the parameters. Defaults to None.
+        integer_angle (bool, optional): Whole degrees in [-rotate_limit, rotate_limit), as the np.random.randint of
+            utils.augment.joint_shift_scale_rotate, instead of a continuous angle. Defaults to False.
+        exact (bool, optional): cv2 chunking option of the numpy augmentations, unused by grid_sample. Defaults to False.
+
+    Returns:
+        dict: Tensors of shape (B,): angle (degrees), scale, dx and dy; identity for samples not transformed.
+    """
+
+    uniform = lambda limit: (2 * torch.rand(B, device=device) - 1) * limit
+    applied = torch.rand(B, device=device) < p
+
+    if integer_angle and rotate_limit:
+        angle = torch.randint(-rotate_limit, rotate_limit, (B,), device=device).float()
+    else:
+        angle = uniform(rotate_limit)
+
+    return {
+        "angle": angle * applied,
+        "scale": 1 + uniform(scale_limit) * applied,
+        "dx": uniform(shift_limit) * applied,
+        "dy": uniform(shift_limit) * applied
+    }
+
+
+def warp_images(images: torch.Tensor, params: dict) -> torch.Tensor:
+    """Rotates and scales frames about their center, then shifts them, with the frames of a sample as channels.
+
+    Matches the geometry of utils.augment.affine_matrix; borders are reflected. Values differ slightly from
+    utils.augment.warp_sequence even where the source lies inside the frame: cv2.warpAffine rounds source
+    coordinates to 1/32 pixel, which changes a value by up to 1/32 of the step to its neighbour.
+
+    Args:
+        images (torch.Tensor): Frames of shape (B, T, 1, H, W).
+        params (dict): Parameters from sample_shift_scale_rotate.
+
+    Returns:
+        torch.Tensor: Warped frames of shape (B, T, 1, H, W).
+    """
+
+    B, T, _, H, W = images.shape
+    theta = torch.deg2rad(params["angle"])
+    cos, sin = torch.cos(theta) / params["scale"], torch.sin(theta) / params["scale"]
+
+    # affine_grid maps output to input coordinates, normalized to [-1, 1]: the inverse of the OpenCV matrix
+    A = torch.stack([
+        torch.stack([cos, -sin * H / W], dim=-1),
+        torch.stack([sin * W / H, cos], dim=-1)
+    ], dim=-2)
+    shift = torch.stack([2 * params["dx"], 2 * params["dy"]], dim=-1)
+    matrix = torch.cat([A, -(A @ shift.unsqueeze(-1))], dim=-1)
+
+    grid = F.affine_grid(matrix.to(images.dtype), (B, T, H, W), align_corners=False)
+    warped = F.grid_sample(images.reshape(B, T, H, W), grid, mode="bilinear", padding_mode="reflection", align_corners=False)
+    return warped.reshape(B, T, 1, H, W)
+
+
+def transform_joints(joints: torch.Tensor, params: dict, valid: torch.Tensor, palm_idx: int = 1) -> torch.Tensor:
+    """Shifts, scales and rotates joint points like utils.augment.joint_shift_scale_rotate.
+
+    The palm point of the first frame is set to zero even without shift; load_joints already normalizes it to zero.
+
+    Args:
+        joints (torch.Tensor): Joint points of shape (B, T, 22 * D).
+        params (dict): Parameters from sample_shift_scale_rotate.
+        valid (torch.Tensor): Bool mask of shape (B, T), False for padding frames.
+        palm_idx (int, optional): Index of the palm joint. Defaults to 1.
+
+    Returns:
+        torch.Tensor: Transformed joint points of shape (B, T, 22 * D).
+    """
+
+    B, T = joints.shape[:2]
+    joints = joints.reshape(B, T, 22, -1).clone()
+
+    # shift, keeping the palm point of the first frame at the origin
+    joints[..., 0] += params["dx"].view(B, 1, 1)
+    joints[..., 1] += params["dy"].view(B, 1, 1)
+    joints[:, 0, palm_idx] = 0
+
+    joints *= params["scale"].view(B, 1, 1, 1)
+
+    # rotation about each frame's palm point, as cv2.getRotationMatrix2D
+    theta = torch.deg2rad(params["angle"])
+    rot_mat = torch.stack([
+        torch.stack([torch.cos(theta), torch.sin(theta)], dim=-1),
+        torch.stack([-torch.sin(theta), torch.cos(theta)], dim=-1)
+    ], dim=-2).to(joints.dtype)
+
+    centers = joints[:, :, palm_idx: palm_idx + 1, :2]
+    joints[..., :2] = torch.einsum("btjk,blk->btjl", joints[..., :2] - centers, rot_mat) + centers
+
+    return joints.reshape(B, T, -1) * valid.unsqueeze(-1)
+
+
+def time_shift(joints: torch.Tensor, images: torch.Tensor, valid: torch.Tensor, frame_limit: int, p: float) -> tuple:
+    """Drops a random number of frames from the start (moving the rest forward) or from the end of each sample.
+
+    Same distribution as utils.augment.time_shift; the dropped frames are masked to zero padding.
+
+    Args:
+        joints (torch.Tensor): Joint points of shape (B, T, 22 * D).
+        images (torch.Tensor): Frames of shape (B, T, 1, H, W).
+        valid (torch.Tensor): Bool mask of shape (B, T), False for padding frames.
+        frame_limit (int): Maximum number of dropped frames.
+        p (float): Probability of shifting a sample.
+
+    Returns:
+        tuple: Shifted joints and images.
+    """
+
+    B, T = joints.shape[:2]
+    device = joints.device
+
+    shift = torch.randint(-frame_limit, frame_limit, (B,), device=device) * (torch.rand(B, device=device) < p)
+    lengths = valid.sum(dim=1)
+
+    t = torch.arange(T, device=device).unsqueeze(0)
+    source = (t + (-shift).clamp(min=0).unsqueeze(1)).clamp(max=T - 1)  # (B, T)
+    keep = (t < (lengths - shift.abs()).unsqueeze(1)).to(joints.dtype)
+
+    joints = torch.gather(joints, 1, source.unsqueeze(-1).expand_as(joints)) * keep.unsqueeze(-1)
+    images = images[torch.arange(B, device=device).unsqueeze(1), source] * keep.view(B, T, 1, 1, 1)
+    return joints, images
+
+
+@torch.no_grad()
+def apply_batch_augs(joints: torch.Tensor, images: torch.Tensor, augs: dict) -> tuple:
+    """Applies the augmentations of transforms.batch_aug to a collated batch.
+
+    Takes the same settings as transforms.aug (see utils.augment.apply_augs).
+
+    Args:
+        joints (torch.Tensor): Joint points of shape (B, T, 22 * D).
+        images (torch.Tensor): Frames of shape (B, T, 1, H, W).
+        augs (dict): Augmentation settings.
+
+    Returns:
+        tuple: Augmented joints and images.
+    """
+
+    B = joints.shape[0]
+    valid = joints.abs().sum(dim=-1) > 0  # padding frames have all-zero joints
+
+    if "shift_scale_rotate" in augs:
+        params = sample_shift_scale_rotate(B, **augs["shift_scale_rotate"], device=joints.device)
+        images = warp_images(images, params)
+        joints = transform_joints(joints, params, valid)
+    else:
+        if "joint_shift_scale_rotate" in augs:
+            params = sample_shift_scale_rotate(B, **augs["joint_shift_scale_rotate"], device=joints.device, integer_angle=True)
+            joints = transform_joints(joints, params, valid)
+
+        if "image_shift_scale_rotate" in augs:
+            images = warp_images(images, sample_shift_scale_rotate(B, **augs["image_shift_scale_rotate"], device=joints.device))
+
+    if "time_shift" in augs:
+        joints, images = time_shift(joints, images, valid, **augs["time_shift"])
+
+    return joints, images
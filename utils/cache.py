@@ -0,0 +1,735 @@
+"""Containers and persistence helpers for the preprocessed dataset cache."""
+
+import numpy as np
+import os
+import json
+import hashlib
+import weakref
+import time
+import functools
+from abc import ABC, abstractmethod
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Callable, Tuple
+from tqdm import tqdm
+
+
+CACHE_VERSION = 2  # bump whenever the on-disk layout changes
+
+
+def sequence_dir(base_dir: str, data_row: np.ndarray) -> str:
+    """Directory holding the frames and skeletons of a data item."""
+    return os.path.join(base_dir, "gesture_{}/finger_{}/subject_{}/essai_{}/".format(*data_row[:4]))
+
+
+def sequence_mtime(seq_dir: str) -> int:
+    """Latest modification time (ns) among the files of a sequence directory."""
+    with os.scandir(seq_dir) as it:
+        return max([entry.stat().st_mtime_ns for entry in it], default=0)
+
+
+def sequence_mtimes(data_list: np.ndarray, base_dir: str) -> np.ndarray:
+    """Modification times (ns) of the sequences in a data list."""
+    return np.array([sequence_mtime(sequence_dir(base_dir, row)) for row in data_list], dtype=np.int64)
+
+
+def cache_key(base_dir: str, T: int, D: int, preprocess_dict: dict, codec: str = None) -> str:
+    """Hashes the settings the cached arrays depend on.
+
+    The data list and source file mtimes are tracked per sequence in the cache manifest instead, so that
+    adding or modifying sequences only requires reprocessing those.
+
+    Args:
+        base_dir (str): Data root.
+        T (int): Sequence length.
+        D (int): Joint dimension.
+        preprocess_dict (dict): Dict containing preprocess specifications.
+        codec (str, optional): Name of the codec of the cached arrays. Defaults to None.
+
+    Returns:
+        str: Hex digest.
+    """
+
+    h = hashlib.sha1()
+    h.update(json.dumps({"version": CACHE_VERSION, "T": T, "D": D, "preprocess": preprocess_dict, "codec": codec, "base_dir": os.path.abspath(base_dir)}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def allocate_cache(N: int, T: int, D: int, preprocess_dict: dict, codec = None) -> dict:
+    """Preallocates a contiguous cache.
+
+    Args:
+        N (int): Number of sequences.
+        T (int): Sequence length.
+        D (int): Joint dimension.
+        preprocess_dict (dict): Dict containing preprocess specifications.
+        codec (optional): Codec from utils.codecs; the blocks then hold encoded sequences. Defaults to None.
+
+    Returns:
+        dict: Cache with a (N, T, 22 * D) "joint" block, a (N, T, 1, H, W) "image" block and a (N,) "lengths" vector.
+            The image block holds uint16 depth values if preprocess_dict["raw_depth"] is set, else uint8.
+    """
+
+    H, W = preprocess_dict["resize"]["H_new"], preprocess_dict["resize"]["W_new"]
+    joint_dtype = np.float32
+    image_shape, image_dtype = (1, H, W), np.uint16 if preprocess_dict.get("raw_depth") else np.uint8
+
+    if codec is not None:
+        joint_dtype = codec.joint_dtype
+        image_shape, image_dtype = codec.image_block(H, W)
+
+    return {
+        "joint": np.zeros((N, T, 22 * D), dtype=joint_dtype),
+        "image": np.zeros((N, T) + image_shape, dtype=image_dtype),
+        "lengths": np.zeros(N, dtype=np.int64)
+    }
+
+
+def load_cache(path: str):
+    """Opens a cache written by save_cache.
+
+    Args:
+        path (str): Cache directory.
+
+    Returns:
+        dict: Cache with memory-mapped blocks, or None if there is no cache at path.
+        np.ndarray: Data list rows of the cached sequences.
+        np.ndarray: Source mtimes of the cached sequences.
+    """
+
+    manifest_path = os.path.join(path, "manifest.npz")
+    if not os.path.exists(manifest_path):
+        return None, None, None
+
+    with np.load(manifest_path) as f:
+        token, rows, mtimes = str(f["token"]), f["rows"], f["mtimes"]
+
+    cache = {k: np.load(os.path.join(path, f"{k}_{token}.npy"), mmap_mode="r") for k in ("joint", "image", "lengths")}
+    return cache, rows, mtimes
+
+
+def save_cache(path: str, rows: np.ndarray, mtimes: np.ndarray, parts: list) -> None:
+    """Writes cache blocks and their manifest.
+
+    Blocks are written under a fresh token and only become visible once the manifest pointing at them is
+    replaced, so an interrupted save leaves the previous cache intact.
+
+    Args:
+        path (str): Cache directory.
+        rows (np.ndarray): Data list rows of all sequences in parts, in order.
+        mtimes (np.ndarray): Source mtimes of all sequences in parts, in order.
+        parts (list): Caches (or memory-mapped caches) written one after another.
+    """
+
+    os.makedirs(path, exist_ok=True)
+    token = os.urandom(8).hex()
+
+    for kind in ("joint", "image", "lengths"):
+        shape = (sum(part[kind].shape[0] for part in parts),) + parts[0][kind].shape[1:]
+        out = np.lib.format.open_memmap(os.path.join(path, f"{kind}_{token}.npy"), mode="w+", dtype=parts[0][kind].dtype, shape=shape)
+
+        i = 0
+        for part in parts:
+            out[i: i + part[kind].shape[0]] = part[kind]
+            i += part[kind].shape[0]
+        out.flush()
+        del out
+
+    tmp_path = os.path.join(path, "manifest.tmp.npz")
+    np.savez(tmp_path, token=token, rows=rows, mtimes=mtimes)
+    os.replace(tmp_path, os.path.join(path, "manifest.npz"))
+
+    for name in os.listdir(path):
+        if name.endswith(".npy") and not name.endswith(f"_{token}.npy"):
+            os.remove(os.path.join(path, name))  # open memory maps stay valid
+
+
+def reuse_cache(path: str, cache: dict, data_list: np.ndarray, base_dir: str):
+    """Fills a cache for data_list with the stored entries that are still valid.
+
+    Args:
+        path (str): Cache directory.
+        cache (dict): Writable cache aligned with data_list, e.g. from allocate_cache.
+        data_list (np.ndarray): Data list.
+        base_dir (str): Data root.
+
+    Returns:
+        np.ndarray: Indices into data_list of new or modified sequences, which still have to be loaded.
+        np.ndarray: Current source mtimes of data_list, to be passed on to store_cache.
+    """
+
+    mtimes = sequence_mtimes(data_list, base_dir)
+    stored, stored_rows, stored_mtimes = load_cache(path)
+
+    if stored is None or stored_rows.shape[1:] != data_list.shape[1:]:
+        return np.arange(data_list.shape[0]), mtimes
+
+    if np.array_equal(stored_rows, data_list) and np.array_equal(stored_mtimes, mtimes):
+        for kind in ("joint", "image", "lengths"):
+            cache[kind][:] = stored[kind]
+        return np.arange(0), mtimes
+
+    index = {row: j for j, row in enumerate(map(tuple, stored_rows.tolist()))}
+    src = np.array([index.get(row, -1) for row in map(tuple, data_list.tolist())], dtype=np.int64)
+    valid = src >= 0
+    valid[valid] = stored_mtimes[src[valid]] == mtimes[valid]
+
+    for kind in ("joint", "image", "lengths"):
+        cache[kind][valid] = stored[kind][src[valid]]
+
+    return np.flatnonzero(~valid), mtimes
+
+
+def store_cache(path: str, cache: dict, data_list: np.ndarray, mtimes: np.ndarray, base_dir: str) -> None:
+    """Merges a cache into the stored one.
+
+    Stored sequences missing from data_list are kept as long as their directory exists, so that e.g. the train
+    and test lists share one cache.
+
+    Args:
+        path (str): Cache directory.
+        cache (dict): Cache aligned with data_list.
+        data_list (np.ndarray): Data list.
+        mtimes (np.ndarray): Source mtimes of data_list, as returned by reuse_cache.
+        base_dir (str): Data root.
+    """
+
+    parts, rows, row_mtimes = [cache], [data_list], [mtimes]
+    stored, stored_rows, stored_mtimes = load_cache(path)
+
+    if stored is not None and stored_rows.shape[1:] == data_list.shape[1:]:
+        current = set(map(tuple, data_list.tolist()))
+        keep = np.array([
+            j for j, row in enumerate(map(tuple, stored_rows.tolist()))
+            if row not in current and os.path.isdir(sequence_dir(base_dir, row))
+        ], dtype=np.int64)
+
+        if len(keep):
+            parts.append({kind: stored[kind][keep] for kind in ("joint", "image", "lengths")})
+            rows.append(stored_rows[keep])
+            row_mtimes.append(stored_mtimes[keep])
+
+    save_cache(path, np.concatenate(rows).astype(np.int64), np.concatenate(row_mtimes), parts)
+
+
+def _unlink(shms: list, owner_pid: int) -> None:
+    if os.getpid() == owner_pid:
+        for shm in shms:
+            shm.unlink()
+
+
+def _create_blocks(shapes: dict):
+    """Creates one shared memory block per entry of shapes, {kind: (shape, dtype)}."""
+
+    spec, shms = {}, {}
+    for kind, (shape, dtype) in shapes.items():
+        shms[kind] = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+        spec[kind] = (shms[kind].name, tuple(shape), np.dtype(dtype).str)
+    return spec, shms
+
+
+def _attach_shared_cache(spec: dict, writeable: bool = False):
+    cache = SharedCache.__new__(SharedCache)
+    cache._setup(spec, {kind: shared_memory.SharedMemory(name=spec[kind][0]) for kind in ("joint", "image", "lengths")}, writeable)
+    return cache
+
+
+class SharedCache(dict):
+    """Cache whose arrays live in shared memory.
+
+    Same layout as the in-memory cache, but the blocks are read-only views into shared_memory. Forked
+    DataLoader workers map the same pages instead of gradually copying them, and pickling (e.g. under spawn)
+    only transfers the block names, workers attach by name.
+    """
+
+    def __init__(self, cache: dict):
+        """
+        Args:
+            cache (dict): Cache, as returned by allocate_cache.
+        """
+
+        super().__init__()
+
+        spec, shms = _create_blocks({kind: (cache[kind].shape, cache[kind].dtype) for kind in ("joint", "image", "lengths")})
+        for kind in ("joint", "image", "lengths"):
+            _, shape, dtype = spec[kind]
+            np.ndarray(shape, dtype, buffer=shms[kind].buf)[:] = cache[kind]
+
+        self._setup(spec, shms)
+        weakref.finalize(self, _unlink, list(shms.values()), os.getpid())
+
+    @classmethod
+    def empty(cls, N: int, T: int, D: int, preprocess_dict: dict, codec = None) -> "SharedCache":
+        """Preallocates a zero-filled, writable cache, e.g. to be filled by several processes with fill_cache.
+
+        Args:
+            N (int): Number of sequences.
+            T (int): Sequence length.
+            D (int): Joint dimension.
+            preprocess_dict (dict): Dict containing preprocess specifications.
+            codec (optional): Codec from utils.codecs. Defaults to None.
+
+        Returns:
+            SharedCache: Cache with the layout of allocate_cache; call seal() once filled.
+        """
+
+        template = allocate_cache(0, T, D, preprocess_dict, codec)
+        spec, shms = _create_blocks({kind: ((N,) + arr.shape[1:], arr.dtype) for kind, arr in template.items()})
+
+        cache = cls.__new__(cls)
+        dict.__init__(cache)
+        cache._setup(spec, shms, writeable=True)
+        weakref.finalize(cache, _unlink, list(shms.values()), os.getpid())
+        return cache
+
+    def _setup(self, spec: dict, shms: dict, writeable: bool = False) -> None:
+        self.spec = spec
+        self._shms = shms  # keeps the mappings alive as long as the views
+
+        for kind in ("joint", "image", "lengths"):
+            _, shape, dtype = spec[kind]
+            self[kind] = np.ndarray(shape, dtype, buffer=shms[kind].buf)
+            self[kind].flags.writeable = writeable
+
+    def seal(self) -> None:
+        """Makes the views read-only."""
+        for kind in ("joint", "image", "lengths"):
+            self[kind].flags.writeable = False
+
+    def __reduce__(self):
+        return (_attach_shared_cache, (self.spec,))
+
+
+class _DecodedField:
+    """Indexable view over one encoded cache block that decodes what is read."""
+
+    def __init__(self, data: np.ndarray, decode: Callable):
+        self.data = data
+        self.decode = decode
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self.decode(self.data[key])
+
+
+class CodecCache:
+    """Serves a cache of encoded sequences, e.g. `cache["image"][c_idx, :n]`, decoding them on access."""
+
+    def __init__(self, cache: dict, codec):
+        """
+        Args:
+            cache (dict): Cache with encoded blocks, e.g. a SharedCache.
+            codec: Codec from utils.codecs the blocks were encoded with.
+        """
+
+        self.cache = cache
+        self.codec = codec
+
+    def __getitem__(self, kind: str):
+        assert kind in ["image", "joint", "lengths"], f"Invalid field {kind}."
+
+        if kind == "image":
+            return _DecodedField(self.cache["image"], self.codec.decode_image)
+        if kind == "joint":
+            return _DecodedField(self.cache["joint"], self.codec.decode_joint)
+        return self.cache["lengths"]
+
+
+def _attach_compressed_cache(spec: dict):
+    cache = CompressedCache.__new__(CompressedCache)
+    cache._setup(spec, {kind: shared_memory.SharedMemory(name=spec[kind][0]) for kind in ("joint", "lengths", "offsets", "data")})
+    return cache
+
+
+class _CompressedField:
+    """Indexable view over the compressed frames of a CompressedCache."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __len__(self):
+        return len(self.cache["lengths"])
+
+    def __getitem__(self, key) -> np.ndarray:
+        c_idx, rest = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        start, end = self.cache.offsets[c_idx], self.cache.offsets[c_idx + 1]
+        return self.cache.codec.decode_image(self.cache.data[start: end])[rest]
+
+
+class CompressedCache(dict):
+    """Cache of variable-length compressed sequences in shared memory.
+
+    `cache["image"][c_idx, :n]` decompresses one sequence on access, the joints and lengths are stored as usual.
+    """
+
+    def __init__(self, joint: np.ndarray, lengths: np.ndarray, chunks: list, codec):
+        """
+        Args:
+            joint (np.ndarray): Joint block of shape (N, T, 22 * D).
+            lengths (np.ndarray): Sequence lengths.
+            chunks (list): Compressed frames of each sequence, as bytes.
+            codec: CompressedCodec the frames were encoded with.
+        """
+
+        super().__init__()
+
+        offsets = np.cumsum([0] + [len(chunk) for chunk in chunks]).astype(np.int64)
+        spec, shms = _create_blocks({
+            "joint": (joint.shape, joint.dtype),
+            "lengths": (lengths.shape, lengths.dtype),
+            "offsets": (offsets.shape, offsets.dtype),
+            "data": ((int(offsets[-1]),), np.uint8)
+        })
+        spec["codec"] = codec
+
+        views = {kind: np.ndarray(spec[kind][1], spec[kind][2], buffer=shms[kind].buf) for kind in ("joint", "lengths", "offsets", "data")}
+        views["joint"][:], views["lengths"][:], views["offsets"][:] = joint, lengths, offsets
+        views["data"][:] = np.frombuffer(b"".join(chunks), dtype=np.uint8)
+
+        self._setup(spec, shms)
+        weakref.finalize(self, _unlink, list(shms.values()), os.getpid())
+
+    def _setup(self, spec: dict, shms: dict) -> None:
+        self.spec = spec
+        self._shms = shms
+        self.codec = spec["codec"]
+
+        for kind in ("joint", "lengths", "offsets", "data"):
+            _, shape, dtype = spec[kind]
+            view = np.ndarray(shape, dtype, buffer=shms[kind].buf)
+            view.flags.writeable = False
+            setattr(self, kind, view)
+
+        self["joint"], self["lengths"] = self.joint, self.lengths
+        self["image"] = _CompressedField(self)
+
+    @property
+    def nbytes(self) -> int:
+        return self.joint.nbytes + self.lengths.nbytes + self.offsets.nbytes + self.data.nbytes
+
+    def __reduce__(self):
+        return (_attach_compressed_cache, (self.spec,))
+
+
+def _compress_chunk(rows: np.ndarray, loader_fn: Callable, codec) -> list:
+    results = []
+    for data_row in rows:
+        joint_points, image_sequence = loader_fn(data_row)
+        results.append((joint_points, codec.encode_image(image_sequence)))
+    return results
+
+
+def compress_cache(data_list: np.ndarray, T: int, D: int, loader_fn: Callable, codec, n_workers: int = 4, chunksize: int = None) -> CompressedCache:
+    """Loads and compresses sequences in parallel.
+
+    Workers return the compressed frames, which are much smaller than the decoded ones, so collecting them in
+    the parent stays cheap.
+
+    Args:
+        data_list (np.ndarray): Data list.
+        T (int): Sequence length.
+        D (int): Joint dimension.
+        loader_fn (Callable): Returns (joint_points, image_sequence) for a data list row.
+        codec: CompressedCodec.
+        n_workers (int, optional): Number of worker processes; 0 loads in this process. Defaults to 4.
+        chunksize (int, optional): Sequences per task. Defaults to about 4 tasks per worker, at most 64 sequences.
+
+    Returns:
+        CompressedCache: Cache aligned with data_list.
+    """
+
+    N = data_list.shape[0]
+    if chunksize is None:
+        chunksize = int(np.clip(np.ceil(N / (4 * max(1, n_workers))), 1, 64))
+
+    tasks = [data_list[k: k + chunksize] for k in range(0, N, chunksize)]
+    compress_fn = functools.partial(_compress_chunk, loader_fn=loader_fn, codec=codec)
+
+    joint = np.zeros((N, T, 22 * D), dtype=np.float32)
+    lengths = np.zeros(N, dtype=np.int64)
+    chunks = []
+
+    with tqdm(total=N) as pbar:
+        pool = mp.Pool(n_workers) if n_workers else None
+        for results in (pool.imap(compress_fn, tasks) if pool else map(compress_fn, tasks)):
+            for joint_points, data in results:
+                i, n = len(chunks), joint_points.shape[0]
+                joint[i, :n], lengths[i] = joint_points, n
+                chunks.append(data)
+            pbar.update(len(results))
+
+        if pool:
+            pool.close()
+            pool.join()
+
+    return CompressedCache(joint, lengths, chunks, codec)
+
+
+_FILL_TARGET = None
+
+
+def _init_fill_worker(spec: dict) -> None:
+    global _FILL_TARGET
+    _FILL_TARGET = _attach_shared_cache(spec, writeable=True)
+
+
+def _fill_chunk(task: tuple, loader_fn: Callable, cache: dict = None) -> int:
+    idxs, rows = task
+    cache = _FILL_TARGET if cache is None else cache
+
+    for i, data_row in zip(idxs, rows):
+        joint_points, image_sequence = loader_fn(data_row)
+        n = joint_points.shape[0]
+        cache["joint"][i, :n] = joint_points
+        cache["image"][i, :n] = image_sequence
+        cache["lengths"][i] = n
+
+    return len(idxs)
+
+
+def fill_cache(cache: SharedCache, data_list: np.ndarray, todo: np.ndarray, loader_fn: Callable, n_workers: int = 4, chunksize: int = None) -> float:
+    """Loads sequences into a cache in parallel.
+
+    Workers attach to the shared blocks once and write every loaded sequence straight to its offset, only the
+    number of finished sequences travels back to the parent.
+
+    Args:
+        cache (SharedCache): Writable cache, see SharedCache.empty.
+        data_list (np.ndarray): Data list the cache is aligned with.
+        todo (np.ndarray): Indices into data_list to load.
+        loader_fn (Callable): Returns (joint_points, image_sequence) for a data list row.
+        n_workers (int, optional): Number of worker processes; 0 loads in this process. Defaults to 4.
+        chunksize (int, optional): Sequences per task. Defaults to about 4 tasks per worker, at most 64 sequences.
+
+    Returns:
+        float: Throughput in sequences/s.
+    """
+
+    if chunksize is None:
+        chunksize = int(np.clip(np.ceil(len(todo) / (4 * max(1, n_workers))), 1, 64))
+
+    tasks = [(todo[k: k + chunksize], data_list[todo[k: k + chunksize]]) for k in range(0, len(todo), chunksize)]
+    start = time.time()
+
+    with tqdm(total=len(todo)) as pbar:
+        if n_workers:
+            with mp.Pool(n_workers, initializer=_init_fill_worker, initargs=(cache.spec,)) as pool:
+                for n_done in pool.imap_unordered(functools.partial(_fill_chunk, loader_fn=loader_fn), tasks):
+                    pbar.update(n_done)
+        else:
+            for task in tasks:
+                pbar.update(_fill_chunk(task, loader_fn, cache))
+
+    return len(todo) / max(time.time() - start, 1e-9)
+
+
+class OnDemandCache(ABC):
+    """Base class of caches that are filled on access instead of by init_cache."""
+
+    @abstractmethod
+    def get(self, c_idx: int, loader: Callable) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the cached sequence, calling loader() to produce it on a miss.
+
+        Args:
+            c_idx (int): Cache index.
+            loader (Callable): Returns (joint_points, image_sequence) of the data item.
+
+        Returns:
+            joint_points (np.ndarray): Array of shape (T', 22 * D).
+            image_sequence (np.ndarray): Array of shape (T', 1, H, W).
+        """
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Access statistics since the last reset_stats()."""
+
+    @abstractmethod
+    def reset_stats(self) -> None:
+        """Zeroes the access statistics."""
+
+
+def _attach_clock_cache(spec: dict, lock):
+    cache = ClockCache.__new__(ClockCache)
+    cache._setup(spec, {kind: shared_memory.SharedMemory(name=spec[kind][0]) for kind in ("joint", "image", "meta")}, lock)
+    return cache
+
+
+class ClockCache(OnDemandCache):
+    """Byte-bounded cache with CLOCK (approximate LRU) eviction, shared by all DataLoader workers.
+
+    A fixed number of sequence slots, the slot table and the hit/miss counters live in shared memory and are
+    guarded by one lock, so every worker sees the entries inserted by the others.
+    """
+
+    def __init__(self, n_items: int, max_bytes: int, T: int, D: int, preprocess_dict: dict):
+        """
+        Args:
+            n_items (int): Number of distinct cache indices.
+            max_bytes (int): Memory budget for the cached arrays.
+            T (int): Sequence length.
+            D (int): Joint dimension.
+            preprocess_dict (dict): Dict containing preprocess specifications.
+        """
+
+        # uint16 image slots for raw depth, as allocate_cache
+        template = allocate_cache(0, T, D, preprocess_dict)
+        slot_bytes = sum(arr.itemsize * int(np.prod(arr.shape[1:])) for kind, arr in template.items() if kind != "lengths")
+        n_slots = max(1, min(n_items, max_bytes // slot_bytes))
+
+        shapes = {
+            "joint": ((n_slots,) + template["joint"].shape[1:], template["joint"].dtype),
+            "image": ((n_slots,) + template["image"].shape[1:], template["image"].dtype),
+            "meta": ((3 * n_slots + n_items + 3,), np.int64)  # slot table, key table, clock hand and counters
+        }
+
+        spec, shms = _create_blocks(shapes)
+        spec.update(n_slots=n_slots, n_items=n_items)
+
+        self._setup(spec, shms, mp.Lock())
+        self.meta[:] = 0
+        self.slot_key[:] = -1
+        self.key_slot[:] = -1
+        weakref.finalize(self, _unlink, list(shms.values()), os.getpid())
+
+    def _setup(self, spec: dict, shms: dict, lock) -> None:
+        self.spec = spec
+        self._shms = shms
+        self.lock = lock
+
+        for kind in ("joint", "image", "meta"):
+            _, shape, dtype = spec[kind]
+            setattr(self, kind, np.ndarray(shape, dtype, buffer=shms[kind].buf))
+
+        S = spec["n_slots"]
+        self.slot_key = self.meta[:S]
+        self.slot_len = self.meta[S: 2 * S]
+        self.ref = self.meta[2 * S: 3 * S]
+        self.key_slot = self.meta[3 * S: -3]
+        self.counters = self.meta[-3:]  # clock hand, hits, misses
+
+    def __reduce__(self):
+        return (_attach_clock_cache, (self.spec, self.lock))
+
+    def _evict(self) -> int:
+        n_slots = self.spec["n_slots"]
+        while True:
+            slot = self.counters[0]
+            self.counters[0] = (slot + 1) % n_slots
+
+            if self.slot_key[slot] < 0 or not self.ref[slot]:
+                return slot
+            self.ref[slot] = 0  # second chance
+
+    def get(self, c_idx: int, loader: Callable) -> Tuple[np.ndarray, np.ndarray]:
+        with self.lock:
+            slot = self.key_slot[c_idx]
+            if slot >= 0:
+                self.ref[slot] = 1
+                self.counters[1] += 1
+                n = self.slot_len[slot]
+                # copy while holding the lock, the slot may be reused right after
+                return self.joint[slot, :n].copy(), self.image[slot, :n].copy()
+            self.counters[2] += 1
+
+        joint_points, image_sequence = loader()
+        n = joint_points.shape[0]
+
+        with self.lock:
+            if self.key_slot[c_idx] < 0:
+                slot = self._evict()
+                if self.slot_key[slot] >= 0:
+                    self.key_slot[self.slot_key[slot]] = -1
+
+                self.joint[slot, :n] = joint_points
+                self.image[slot, :n] = image_sequence
+                self.slot_len[slot] = n
+                self.slot_key[slot] = c_idx
+                self.key_slot[c_idx] = slot
+                self.ref[slot] = 1
+
+        return joint_points, image_sequence
+
+    def stats(self) -> dict:
+        hits, misses = int(self.counters[1]), int(self.counters[2])
+        return {"cache_hits": hits, "cache_misses": misses, "cache_hit_rate": hits / max(1, hits + misses)}
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.counters[1:] = 0
+
+
+def _attach_lazy_cache(spec: dict, lock):
+    cache = LazySharedCache.__new__(LazySharedCache)
+    cache._setup(spec, {kind: shared_memory.SharedMemory(name=spec[kind][0]) for kind in ("joint", "image", "lengths", "counters")}, lock)
+    return cache
+
+
+class LazySharedCache(OnDemandCache):
+    """Full-size cache in shared memory that starts empty and is filled by whichever worker first loads an item.
+
+    The first epoch runs at uncached speed while warming the cache, later epochs are served from memory, without
+    the upfront init_cache pass. Entries never change once filled, so reads need no lock.
+    """
+
+    def __init__(self, n_items: int, T: int, D: int, preprocess_dict: dict):
+        """
+        Args:
+            n_items (int): Number of distinct cache indices.
+            T (int): Sequence length.
+            D (int): Joint dimension.
+            preprocess_dict (dict): Dict containing preprocess specifications.
+        """
+
+        # shared memory is zero-filled and only backed by RAM once touched
+        template = allocate_cache(0, T, D, preprocess_dict)
+        shapes = {kind: ((n_items,) + arr.shape[1:], arr.dtype) for kind, arr in template.items()}
+        shapes["counters"] = ((2,), np.int64)  # hits, misses
+
+        spec, shms = _create_blocks(shapes)
+        self._setup(spec, shms, mp.Lock())
+        weakref.finalize(self, _unlink, list(shms.values()), os.getpid())
+
+    def _setup(self, spec: dict, shms: dict, lock) -> None:
+        self.spec = spec
+        self._shms = shms
+        self.lock = lock
+
+        for kind in ("joint", "image", "lengths", "counters"):
+            _, shape, dtype = spec[kind]
+            setattr(self, kind, np.ndarray(shape, dtype, buffer=shms[kind].buf))
+
+    def __reduce__(self):
+        return (_attach_lazy_cache, (self.spec, self.lock))
+
+    def get(self, c_idx: int, loader: Callable) -> Tuple[np.ndarray, np.ndarray]:
+        n = self.lengths[c_idx]
+        if n > 0:
+            with self.lock:
+                self.counters[0] += 1
+
+            joint_points, image_sequence = self.joint[c_idx, :n], self.image[c_idx, :n]
+            joint_points.flags.writeable = False
+            image_sequence.flags.writeable = False
+            return joint_points, image_sequence
+
+        with self.lock:
+            self.counters[1] += 1
+
+        joint_points, image_sequence = loader()
+        n = joint_points.shape[0]
+
+        self.joint[c_idx, :n] = joint_points
+        self.image[c_idx, :n] = image_sequence
+        self.lengths[c_idx] = n  # written last, an entry with a length is complete
+
+        return joint_points, image_sequence
+
+    def stats(self) -> dict:
+        hits, misses = int(self.counters[0]), int(self.counters[1])
+        return {"cache_hits": hits, "cache_misses": misses, "cache_hit_rate": hits / max(1, hits + misses)}
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.counters[:] = 0
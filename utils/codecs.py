@@ -0,0 +1,146 @@
+"""Compact and compressed encodings of cached sequences."""
+
+import numpy as np
+import zlib
+from typing import Callable, Tuple
+
+
+class CompactCodec:
+    """Stores gvar frames as 4-bit gray level indices, two per byte, and joints as float16.
+
+    gvar output only takes the values 0 and g_min + k * stride for k = 0..eta, so with eta <= 14 each pixel fits
+    into a nibble. Frames are restored exactly, joints lose precision beyond float16 (about 3 significant digits).
+    """
+
+    name = "compact"
+    joint_dtype = np.float16
+
+    def __init__(self, gvar_dict: dict, W: int):
+        """
+        Args:
+            gvar_dict (dict): gvar settings, as in transforms.preprocess.gvar.
+            W (int): Frame width.
+        """
+
+        eta, g_min, g_max = gvar_dict["eta"], gvar_dict["g_min"], gvar_dict["g_max"]
+        g_stride = int((g_max - g_min) / eta)
+
+        assert eta <= 14, f"eta={eta} gray levels do not fit into 4 bits, use eta <= 14."
+        assert g_min + eta * g_stride <= 255, "gvar levels exceed the uint8 range."
+
+        # code 0 is the background, code k + 1 the k-th gray level
+        self.lut = np.zeros(16, dtype=np.uint8)
+        self.lut[1: eta + 2] = g_min + np.arange(eta + 1) * g_stride
+
+        self.inverse = np.full(256, 16, dtype=np.uint8)
+        self.inverse[self.lut[1: eta + 2]] = np.arange(1, eta + 2)
+        self.inverse[0] = 0
+
+        self.W = W
+
+    def image_block(self, H: int, W: int) -> Tuple[tuple, np.dtype]:
+        """Per-frame shape and dtype of encoded frames."""
+        return (1, H, (W + 1) // 2), np.uint8
+
+    def encode_image(self, image_sequence: np.ndarray) -> np.ndarray:
+        """Packs frames of shape (T', 1, H, W) into an array of shape (T', 1, H, ceil(W / 2))."""
+
+        codes = self.inverse[image_sequence]
+        assert codes.max(initial=0) < 16, "Frames contain values that are not gvar levels."
+
+        if self.W % 2:
+            codes = np.pad(codes, [(0, 0)] * (codes.ndim - 1) + [(0, 1)])
+
+        return codes[..., 0::2] | (codes[..., 1::2] << 4)
+
+    def decode_image(self, packed: np.ndarray) -> np.ndarray:
+        """Inverse of encode_image."""
+
+        image_sequence = np.empty(packed.shape[:-1] + (2 * packed.shape[-1],), dtype=np.uint8)
+        image_sequence[..., 0::2] = self.lut[packed & 15]
+        image_sequence[..., 1::2] = self.lut[packed >> 4]
+        return image_sequence[..., :self.W]
+
+    def encode_joint(self, joint_points: np.ndarray) -> np.ndarray:
+        return joint_points.astype(np.float16)
+
+    def decode_joint(self, joint_points: np.ndarray) -> np.ndarray:
+        return joint_points.astype(np.float32)
+
+
+class CompressedCodec:
+    """Compresses the frames of each sequence into a variable-length byte string.
+
+    'zlib' deflates the frames as they are, which mostly pays off through the zero background around the hand.
+    'delta' first replaces every frame by its (wrapping) difference to the previous frame, so the similar
+    consecutive frames of a gesture become mostly zeros as well. Both are lossless; decoding happens on access,
+    i.e. in the DataLoader workers.
+    """
+
+    joint_dtype = np.float32
+
+    def __init__(self, name: str, frame_shape: tuple, dtype: np.dtype, level: int = 1):
+        """
+        Args:
+            name (str): 'zlib' or 'delta'.
+            frame_shape (tuple): Shape (1, H, W) of a frame.
+            dtype (np.dtype): Frame dtype.
+            level (int, optional): zlib compression level. Defaults to 1.
+        """
+
+        assert name in ["zlib", "delta"], f"Invalid compression {name}."
+
+        self.name = name
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.level = level
+
+    def encode_image(self, image_sequence: np.ndarray) -> bytes:
+        image_sequence = np.ascontiguousarray(image_sequence, dtype=self.dtype)
+        if self.name == "delta":
+            image_sequence = np.diff(image_sequence, axis=0, prepend=np.zeros_like(image_sequence[:1]))
+        return zlib.compress(image_sequence.tobytes(), self.level)
+
+    def decode_image(self, data: bytes) -> np.ndarray:
+        image_sequence = np.frombuffer(zlib.decompress(data), dtype=self.dtype).reshape(-1, *self.frame_shape)
+        if self.name == "delta":
+            return np.cumsum(image_sequence, axis=0, dtype=self.dtype)  # wraps around like the encoding
+        return image_sequence.copy()
+
+    def encode_joint(self, joint_points: np.ndarray) -> np.ndarray:
+        return joint_points.astype(np.float32)
+
+    def decode_joint(self, joint_points: np.ndarray) -> np.ndarray:
+        return joint_points
+
+
+def get_codec(name: str, preprocess_dict: dict):
+    """Creates the cache codec selected by exp.cache_codec.
+
+    Args:
+        name (str): Codec name, or None.
+        preprocess_dict (dict): Dict containing preprocess specifications.
+
+    Returns:
+        Codec, or None if name is None.
+    """
+
+    if name is None:
+        return None
+
+    if name == "compact":
+        assert "gvar" in preprocess_dict and not preprocess_dict.get("raw_depth"), "The compact codec only stores gvar frames."
+        return CompactCodec(preprocess_dict["gvar"], preprocess_dict["resize"]["W_new"])
+
+    if name in ["zlib", "delta"]:
+        frame_shape = (1, preprocess_dict["resize"]["H_new"], preprocess_dict["resize"]["W_new"])
+        return CompressedCodec(name, frame_shape, np.uint16 if preprocess_dict.get("raw_depth") else np.uint8)
+
+    raise ValueError(f"Invalid cache codec {name}.")
+
+
+def encode_loaded(data_row: np.ndarray, loader_fn: Callable, codec) -> Tuple[np.ndarray, np.ndarray]:
+    """Loads a sequence with loader_fn and encodes it."""
+
+    joint_points, image_sequence = loader_fn(data_row)
+    return codec.encode_joint(joint_points), codec.encode_image(image_sequence)
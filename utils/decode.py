@@ -0,0 +1,74 @@
+"""Interchangeable readers and writers of single depth frames."""
+
+import numpy as np
+import os
+import cv2
+from PIL import Image
+
+
+class PILDecoder:
+    """16-bit PNG frames through PIL."""
+
+    name = "pil"
+    ext = ".png"
+
+    def read(self, f) -> np.ndarray:
+        return np.array(Image.open(f))
+
+    def write(self, path: str, image: np.ndarray) -> None:
+        Image.fromarray(image).save(path)
+
+
+class CV2Decoder:
+    """16-bit PNG frames through OpenCV, read with IMREAD_ANYDEPTH so that depth values are kept."""
+
+    name = "cv2"
+    ext = ".png"
+
+    def read(self, f) -> np.ndarray:
+        if isinstance(f, str):
+            image = cv2.imread(f, cv2.IMREAD_ANYDEPTH)
+        else:
+            image = cv2.imdecode(np.frombuffer(f.getbuffer(), dtype=np.uint8), cv2.IMREAD_ANYDEPTH)
+
+        assert image is not None, f"Could not decode {f}."
+        return image
+
+    def write(self, path: str, image: np.ndarray) -> None:
+        cv2.imwrite(path, image)
+
+
+class NpyDecoder:
+    """Uncompressed .npy frames, stored next to (or instead of) the PNGs with the same name stem."""
+
+    name = "npy"
+    ext = ".npy"
+
+    def read(self, f) -> np.ndarray:
+        return np.load(f)
+
+    def write(self, path: str, image: np.ndarray) -> None:
+        with open(path, "wb") as f:
+            np.save(f, image)  # np.save would append .npy to paths without it
+
+
+DECODERS = {decoder.name: decoder for decoder in (PILDecoder(), CV2Decoder(), NpyDecoder())}
+
+
+def get_decoder(name: str = "pil"):
+    """Frame decoder selected by exp.decoder.
+
+    Args:
+        name (str, optional): One of 'pil', 'cv2' or 'npy'. Defaults to 'pil'.
+
+    Returns:
+        Decoder with read(file), write(path, image) and the frame file extension ext.
+    """
+
+    assert name in DECODERS, f"Invalid decoder {name}, use one of {list(DECODERS)}."
+    return DECODERS[name]
+
+
+def frame_path(path: str, decoder) -> str:
+    """Path of a '.png' frame as stored for the given decoder."""
+    return os.path.splitext(path)[0] + decoder.ext
@@ -1,5 +1,9 @@
 import numpy as np
 
+
+CHUNK_PIXELS = 1 << 15  # pixels per chunk of frames quantized together
+
+
 def grayscale_variation(image: np.ndarray, eta: int = 10, g_min: int = 155, g_max: int = 255, near_depth_thresh: int = 200) -> np.ndarray:
     """Quantizes depth levels into discrete grayscale image levels.
 
@@ -23,4 +27,69 @@ def grayscale_variation(image: np.ndarray, eta: int = 10, g_min: int = 155, g_ma
         d_min = 0
     
     g_stride = int((g_max - g_min) / eta)
-    return np.where(mask, g_min + np.round(eta * (image - d_min) / (d_th - d_min)) * g_stride, 0).astype(np.uint8)
\ No newline at end of file
+    return np.where(mask, g_min + np.round(eta * (image - d_min) / (d_th - d_min)) * g_stride, 0).astype(np.uint8)
+
+def grayscale_variation_sequence(images: np.ndarray, eta: int = 10, g_min: int = 155, g_max: int = 255, near_depth_thresh: int = 200, out: np.ndarray = None) -> np.ndarray:
+    """Applies grayscale_variation to every frame of a sequence at once.
+
+    Per-frame d_th and d_min come from (masked) reductions over the whole stack, and the quantization runs in a
+    single float32 buffer instead of several float64 temporaries. For uint8 and uint16 depth the float32 division
+    is exact enough that rounding, and hence the result, is identical to quantizing each frame separately. The gray
+    levels g_min + k * g_stride are integers, so they are formed in place and cast into the output.
+
+    Args:
+        images (np.ndarray): Input images of shape (T, 1, H, W).
+        eta (int, optional): Number of gray levels. Defaults to 10.
+        g_min (int, optional): Lowest gray level. Defaults to 155.
+        g_max (int, optional): Highest gray level. Defaults to 255.
+        near_depth_thresh (int, optional): Minimum considered depth. Defaults to 200.
+        out (np.ndarray, optional): uint8 array of the same shape to write into. Defaults to None.
+
+    Returns:
+        np.ndarray: Depth quantized images, identical to quantizing each frame separately.
+    """
+
+    axes = tuple(range(1, images.ndim))
+    integer = np.issubdtype(images.dtype, np.integer)
+    fill = np.iinfo(images.dtype).max if integer else np.inf
+
+    if out is None:
+        out = np.empty(images.shape, dtype=np.uint8)
+    assert out.shape == images.shape and out.dtype == np.uint8, "out must be a uint8 array of the input shape."
+
+    d_th = np.maximum(images.max(axis=axes, keepdims=True), 1)
+    mask = images > near_depth_thresh
+
+    d_min = images.min(axis=axes, keepdims=True, where=mask, initial=fill)
+    d_min = np.where(mask.any(axis=axes, keepdims=True), d_min, 0).astype(images.dtype)
+    denom = (d_th - d_min).astype(images.dtype)
+
+    g_stride = int((g_max - g_min) / eta)
+    work_dtype = np.float32 if images.dtype.itemsize <= 2 else np.float64
+
+    # eta * (image - d_min) is computed in the input dtype by the per-frame version, which only matters if it can wrap around
+    wraps = integer and eta * int(denom.max(initial=0)) > np.iinfo(images.dtype).max
+
+    # elementwise work runs over a few frames at a time, so that the float buffer stays in cache
+    step = max(1, CHUNK_PIXELS // max(1, images[0].size))
+    for t in range(0, images.shape[0], step):
+        chunk = slice(t, t + step)
+
+        if wraps:
+            work = np.multiply(np.subtract(images[chunk], d_min[chunk], dtype=images.dtype), eta, dtype=images.dtype, casting="unsafe").astype(work_dtype)
+        else:
+            work = np.subtract(images[chunk], d_min[chunk], dtype=work_dtype)
+            work *= eta
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            work /= denom[chunk]
+        np.rint(work, out=work)  # rounds half to even, as np.round
+        work *= g_stride
+        work += g_min
+
+        out[chunk] = 0
+        np.copyto(out[chunk], work, casting="unsafe", where=mask[chunk])
+
+    # frames with d_th == d_min give 0 / 0, which the per-frame version casts to 0
+    out[(denom == 0).reshape(-1)] = 0
+    return out
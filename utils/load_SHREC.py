@@ -2,19 +2,25 @@
 
 import numpy as np
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, IterableDataset, RandomSampler, SequentialSampler
 import os
 from utils.load_utils import *
-from utils.augment import apply_augs
-from tqdm import tqdm
+from utils.augment import apply_augs, ScratchBuffers
+from utils.packed import PackedStore, pyramid_level
+from models.fusion_network import get_res_in
+from utils.stream import StreamingDataset
+from utils.prefetch import ReadAheadSampler
+from utils.skeletons import get_skeleton_store
+from utils.decode import get_decoder
+from utils.codecs import get_codec, encode_loaded, CompressedCodec
+from utils.cache import cache_key, reuse_cache, store_cache, fill_cache, SharedCache, CodecCache, compress_cache, OnDemandCache, ClockCache, LazySharedCache
 import functools
-import multiprocessing as mp
 
 
 class SHREC_Dataset(Dataset):
     """Dataset wrapper for SHREC."""
 
-    def __init__(self, data_list: np.array, base_dir: str, D: int, T: int, num_classes: int, transform_dict: dict, cache = None, train = True):
+    def __init__(self, data_list: np.array, base_dir: str, D: int, T: int, num_classes: int, transform_dict: dict, cache = None, train = True, n_threads: int = 0, quantize: bool = True, decoder: str = "pil"):
         
         super().__init__()
 
@@ -28,30 +34,54 @@ class SHREC_Dataset(Dataset):
         self.transform_dict = transform_dict
         self.cache = cache
         self.train = train
+        self.n_threads = n_threads
+        self.decoder = decoder
+
+        # per-worker arrays for quantized and augmented frames, so cached arrays are never written to
+        self.scratch = ScratchBuffers(T)
+
+        # without quantize, items hold resized raw depth for models that quantize in-graph (models.preprocess)
+        self.quantize = quantize
+        if not quantize:
+            self.transform_dict = dict(transform_dict, preprocess=raw_depth_preprocess(transform_dict["preprocess"]))
 
     def __len__(self):
         return self.data_list.shape[0]
 
     @staticmethod
-    def get_image_joint(data_row: np.ndarray, base_dir: str, T: int, D: int, transform_dict: dict):
+    def get_image_joint(data_row: np.ndarray, base_dir: str, T: int, D: int, transform_dict: dict, n_threads: int = 0, decoder: str = "pil"):
         num_frames = data_row[6]
         frame_idxs = get_samples(0, num_frames-1, T)
 
         path_identifier = "gesture_{}/finger_{}/subject_{}/essai_{}/".format(*data_row[:4])
 
         # Loading joint points
-        joint_path = os.path.join(
-            base_dir, path_identifier, "skeletons_image.txt" if D == 2 else "skeletons_world.txt"
-        )
-        joint_points = load_joints(joint_path, frame_idxs, T)
+        joint_file = "skeletons_image.txt" if D == 2 else "skeletons_world.txt"
+        joint_path = os.path.join(base_dir, path_identifier, joint_file)
+        joint_points = load_joints(joint_path, frame_idxs, T, get_skeleton_store(base_dir, joint_file))
 
         # Loading images
         image_folder_path = os.path.join(base_dir, path_identifier)
-        image_sequence = load_image_sequence(image_folder_path, frame_idxs, T, transform_dict["preprocess"])
+        image_sequence = load_image_sequence(image_folder_path, frame_idxs, T, transform_dict["preprocess"], n_threads=n_threads, decoder=decoder)
 
         return joint_points, image_sequence
 
 
+    def source_files(self, idx: int) -> list:
+        """Paths of the raw files read by get_image_joint for a data item."""
+
+        data_row = self.data_list[idx]
+        frame_idxs = get_samples(0, data_row[6] - 1, self.T)
+        path_identifier = "gesture_{}/finger_{}/subject_{}/essai_{}/".format(*data_row[:4])
+
+        files = [os.path.join(self.base_dir, path_identifier, f"{i}_depth{get_decoder(self.decoder).ext}") for i in frame_idxs]
+
+        joint_file = "skeletons_image.txt" if self.D == 2 else "skeletons_world.txt"
+        if get_skeleton_store(self.base_dir, joint_file) is None:
+            files.append(os.path.join(self.base_dir, path_identifier, joint_file))
+
+        return files
+
     def __getitem__(self, idx):
         """Args:
             idx (int): Index of data item.
@@ -68,26 +98,43 @@ class SHREC_Dataset(Dataset):
 
         num_frames = self.data_list[idx, 6]
 
-        if self.cache is not None:
+        if isinstance(self.cache, OnDemandCache):
+            joint_points, image_sequence = self.cache.get(
+                self.data_list[idx, 7],
+                lambda: self.get_image_joint(self.data_list[idx], self.base_dir, self.T, self.D, self.transform_dict, self.n_threads, self.decoder)
+            )
+        elif self.cache is not None:
             c_idx = self.data_list[idx, 7]
-            joint_points, image_sequence = self.cache["joint"][c_idx], self.cache["image"][c_idx]
+            n = self.cache["lengths"][c_idx]
+            joint_points, image_sequence = self.cache["joint"][c_idx, :n], self.cache["image"][c_idx, :n]
         else:
             joint_points, image_sequence = self.get_image_joint(
-                self.data_list[idx], self.base_dir, self.T, self.D, self.transform_dict
+                self.data_list[idx], self.base_dir, self.T, self.D, self.transform_dict, self.n_threads, self.decoder
             )
 
-        if self.train and self.transform_dict["aug"] is not None:
-            joint_points, image_sequence = apply_augs(joint_points, image_sequence, self.transform_dict["aug"])
+        if image_sequence.dtype != np.uint8 and self.quantize:
+            # raw depth cache
+            image_sequence = quantize_sequence(image_sequence, self.transform_dict["preprocess"], out=self.scratch.get("quantized", image_sequence.shape, np.uint8))
+
+        assert self.quantize or image_sequence.dtype != np.uint8, "Cached frames are already quantized, the model expects raw depth."
 
-        # bring values to 0-1 range & make float32
-        joint_points = joint_points.astype(np.float32)
-        image_sequence = (image_sequence / 255).astype(np.float32)
+        if self.train and self.transform_dict["aug"] is not None:
+            # augmented sequences go to the scratch buffers, the inputs (possibly cached and shared) stay intact
+            joint_points, image_sequence = apply_augs(joint_points, image_sequence, self.transform_dict["aug"], scratch=self.scratch)
 
+        # bring values to 0-1 range & make float32, zero padded to T frames; fresh per item, the tensors share their memory
         num_frames = joint_points.shape[0]
-        
-        if num_frames < self.T:
-            joint_points = np.pad(joint_points, ((0, self.T - num_frames), (0, 0)), mode='constant')
-            image_sequence = np.pad(image_sequence, ((0, self.T - num_frames), (0, 0), (0, 0), (0, 0)), mode="constant")
+
+        joint_seq = np.zeros((self.T, joint_points.shape[1]), dtype=np.float32)
+        joint_seq[:num_frames] = joint_points
+
+        image_seq = np.zeros((self.T, *image_sequence.shape[1:]), dtype=np.float32)
+        if self.quantize:
+            np.divide(image_sequence, 255, out=image_seq[:num_frames])
+        else:
+            image_seq[:num_frames] = image_sequence
+
+        joint_points, image_sequence = joint_seq, image_seq
 
         return (
             torch.from_numpy(joint_points),
@@ -97,49 +144,114 @@ class SHREC_Dataset(Dataset):
 
         
 
-def init_cache(data_list: np.ndarray, base_dir: str, T: int, D: int, transform_dict: dict, n_cache_workers : int = 4):
-    """Loads entire training set into memory for later use."""
+def init_cache(data_list: np.ndarray, base_dir: str, T: int, D: int, transform_dict: dict, n_cache_workers : int = 4, cache_dir: str = None, n_threads: int = 0, raw_depth: bool = False, codec: str = None, decoder: str = "pil"):
+    """Loads entire training set into memory for later use.
+
+    If raw_depth is set, frames are cached as resized uint16 depth values and quantized per sample instead, so
+    that the cache (and its stored copy) can be reused across gvar settings.
+
+    If cache_dir is given, the cache is stored there under a hash of the settings, together with a manifest of
+    the cached data list rows and source file mtimes. Later runs only load new or modified sequences and merge
+    them into the stored cache.
 
-    cache = {"joint": [], "image": []}
-    
+    The cache is allocated in shared memory, cache workers write each sequence directly into it. The returned
+    SharedCache can be passed to DataLoader workers without copying.
+
+    If codec is given (see utils.codecs.get_codec), sequences are stored encoded and decoded on access through
+    a CodecCache, or compressed into a CompressedCache ('zlib', 'delta'), which is not stored in cache_dir.
+    """
+
+    if raw_depth:
+        transform_dict = dict(transform_dict, preprocess=raw_depth_preprocess(transform_dict["preprocess"]))
+
+    cache_codec = get_codec(codec, transform_dict["preprocess"])
     loader_fn = functools.partial(
         SHREC_Dataset.get_image_joint,
         base_dir=base_dir,
         T=T,
         D=D,
-        transform_dict=transform_dict
+        transform_dict=transform_dict,
+        n_threads=n_threads,
+        decoder=decoder
     )
 
-    pool = mp.Pool(n_cache_workers)
+    if isinstance(cache_codec, CompressedCodec):
+        # variable-length sequences, not stored in cache_dir
+        cache = compress_cache(data_list, T, D, loader_fn, cache_codec, n_cache_workers)
+        print(f"Compressed {data_list.shape[0]} sequences into {cache.nbytes / 2**20:.1f} MiB.")
+        return cache
+
+    cache = SharedCache.empty(data_list.shape[0], T, D, transform_dict["preprocess"], cache_codec)
+    todo = np.arange(data_list.shape[0])
 
-    for (joint_points, image_sequence) in tqdm(pool.imap(func=loader_fn, iterable=data_list), total=data_list.shape[0]):
-        cache["joint"].append(joint_points)
-        cache["image"].append(image_sequence)
-    
-    pool.close()
-    pool.join()
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f"shrec_{cache_key(base_dir, T, D, transform_dict['preprocess'], codec)}")
+        todo, mtimes = reuse_cache(cache_path, cache, data_list, base_dir)
+        print(f"Reusing {data_list.shape[0] - len(todo)} of {data_list.shape[0]} sequences from {cache_path}.")
 
-    return cache
+    if len(todo):
+        if cache_codec is not None:
+            loader_fn = functools.partial(encode_loaded, loader_fn=loader_fn, codec=cache_codec)
+
+        rate = fill_cache(cache, data_list, todo, loader_fn, n_cache_workers)
+        print(f"Cached {len(todo)} sequences at {rate:.1f} sequences/s.")
+
+        if cache_dir is not None:
+            store_cache(cache_path, cache, data_list, mtimes, base_dir)
+            print(f"Saved cache to {cache_path}.")
+
+    cache.seal()
+    return cache if cache_codec is None else CodecCache(cache, cache_codec)
             
 
 def build_loader(data_list: np.ndarray, config: dict, cache: dict, train: bool = True):
-    dataset = SHREC_Dataset(
-        data_list = data_list,
-        base_dir = config["data_root"],
-        D = config["hparams"]["model"]["D"],
-        T = config["hparams"]["model"]["T"],
-        num_classes = config["hparams"]["model"]["num_classes"],
-        transform_dict = config["hparams"]["transforms"],
-        cache = cache,
-        train = train
-    )
+    if config["exp"].get("backend", "raw") == "tar":
+        assert not config["hparams"]["model"].get("quantize_in_model", False), "Tar shards hold quantized frames, the model expects raw depth."
+        dataset = StreamingDataset(
+            root = config["packed_root"],
+            data_list = data_list,
+            T = config["hparams"]["model"]["T"],
+            num_classes = config["hparams"]["model"]["num_classes"],
+            transform_dict = config["hparams"]["transforms"],
+            train = train,
+            shuffle_buffer = config["exp"].get("shuffle_buffer", 256),
+            seed = config["hparams"]["seed"]
+        )
+        dataset.check(config["hparams"]["model"]["T"], config["hparams"]["model"]["D"], config["hparams"]["transforms"]["preprocess"])
+        # workers stream disjoint sets of shards, workers without a shard would idle
+        assert not train or len(dataset.shards) >= config["exp"]["n_workers"], f"{len(dataset.shards)} tar shards for {config['exp']['n_workers']} workers, repack with a smaller --shard_size."
+    else:
+        dataset = SHREC_Dataset(
+            data_list = data_list,
+            base_dir = config["data_root"],
+            D = config["hparams"]["model"]["D"],
+            T = config["hparams"]["model"]["T"],
+            num_classes = config["hparams"]["model"]["num_classes"],
+            transform_dict = config["hparams"]["transforms"],
+            cache = cache,
+            train = train,
+            n_threads = config["exp"].get("n_decode_threads", 0),
+            quantize = not config["hparams"]["model"].get("quantize_in_model", False),
+            decoder = config["exp"].get("decoder", "pil")
+        )
+
+    sampler = None
+    if config["exp"].get("prefetch", 0) and cache is None and not isinstance(dataset, IterableDataset):
+        sampler = ReadAheadSampler(
+            RandomSampler(dataset) if train else SequentialSampler(dataset),
+            dataset,
+            depth = config["exp"]["prefetch"],
+            max_bytes = config["exp"].get("prefetch_mb", 256) << 20,
+            keep = config["exp"]["n_workers"] == 0
+        )
 
     dataloader = DataLoader(
         dataset,
         batch_size = config["hparams"]["batch_size"],
         num_workers = config["exp"]["n_workers"],
         pin_memory = config["exp"]["pin_memory"],
-        shuffle = True if train else False
+        sampler = sampler,
+        shuffle = train and sampler is None and not isinstance(dataset, IterableDataset)  # streaming datasets shuffle themselves
     )
 
     return dataloader
@@ -149,14 +261,58 @@ def get_loaders(config):
     test_list = np.loadtxt(config["test_list_path"], np.int32)
     cache_train, cache_test = None, None
 
-    if config["exp"]["cache"]:
+    preprocess = config["hparams"]["transforms"]["preprocess"]
+    if config["hparams"]["model"].get("quantize_in_model", False):
+        preprocess = raw_depth_preprocess(preprocess)  # caches hold what the dataset loads
+
+    if config["exp"].get("backend", "raw") == "packed":
+        cache_train = PackedStore(config["packed_root"], train_list)
+        cache_test = PackedStore(config["packed_root"], test_list)
+        cache_train.check(config["hparams"]["model"]["T"], config["hparams"]["model"]["D"], config["hparams"]["transforms"]["preprocess"])
+
+    elif config["exp"].get("backend", "raw") == "pyramid":
+        res_in = get_res_in(config["hparams"]["model"])
+        level_root = pyramid_level(config["packed_root"], res_in)
+        cache_train = PackedStore(level_root, train_list)
+        cache_test = PackedStore(level_root, test_list)
+        cache_train.check(config["hparams"]["model"]["T"], config["hparams"]["model"]["D"], {"resize": {"H_new": res_in[0], "W_new": res_in[1]}, "raw_depth": True})
+
+    elif config["exp"]["cache"] and config["exp"].get("backend", "raw") == "raw" and config["exp"].get("cache_mode", "full") == "lru":
+        # one cache_mb budget, split in proportion to the sizes of the splits
+        n_total = len(train_list) + len(test_list)
+        cache_train, cache_test = [
+            ClockCache(
+                len(data_list),
+                (config["exp"]["cache_mb"] << 20) * len(data_list) // n_total,
+                config["hparams"]["model"]["T"],
+                config["hparams"]["model"]["D"],
+                preprocess
+            ) for data_list in (train_list, test_list)
+        ]
+
+    elif config["exp"]["cache"] and config["exp"].get("backend", "raw") == "raw" and config["exp"].get("cache_mode", "full") == "lazy":
+        cache_train, cache_test = [
+            LazySharedCache(
+                len(data_list),
+                config["hparams"]["model"]["T"],
+                config["hparams"]["model"]["D"],
+                preprocess
+            ) for data_list in (train_list, test_list)
+        ]
+
+    elif config["exp"]["cache"] and config["exp"].get("backend", "raw") == "raw":
         cache_train = init_cache(
             train_list,
             config["data_root"],
             config["hparams"]["model"]["T"],
             config["hparams"]["model"]["D"],
             config["hparams"]["transforms"],
-            config["exp"]["n_cache_workers"]
+            config["exp"]["n_cache_workers"],
+            config["exp"].get("cache_dir"),
+            config["exp"].get("n_decode_threads", 0),
+            config["exp"].get("cache_raw_depth", False) or config["hparams"]["model"].get("quantize_in_model", False),
+            config["exp"].get("cache_codec"),
+            config["exp"].get("decoder", "pil")
         )
 
         cache_test = init_cache(
@@ -165,7 +321,12 @@ def get_loaders(config):
             config["hparams"]["model"]["T"],
             config["hparams"]["model"]["D"],
             config["hparams"]["transforms"],
-            config["exp"]["n_cache_workers"]
+            config["exp"]["n_cache_workers"],
+            config["exp"].get("cache_dir"),
+            config["exp"].get("n_decode_threads", 0),
+            config["exp"].get("cache_raw_depth", False) or config["hparams"]["model"].get("quantize_in_model", False),
+            config["exp"].get("cache_codec"),
+            config["exp"].get("decoder", "pil")
         )
 
     train_list = np.hstack([train_list, np.arange(len(train_list)).reshape(-1, 1)])
@@ -1,7 +1,31 @@
 import numpy as np
 import os
 from PIL import Image
-from utils.gvar import  grayscale_variation
+from concurrent.futures import ThreadPoolExecutor
+from utils.gvar import  grayscale_variation, grayscale_variation_sequence, CHUNK_PIXELS
+from utils.skeletons import SkeletonStore
+from utils.prefetch import open_prefetched
+from utils.resize import resize_sequence
+from utils.decode import get_decoder
+
+
+_THREAD_POOLS = {}
+
+
+def get_thread_pool(n_threads: int) -> ThreadPoolExecutor:
+    """Thread pool shared by all loads of the current process.
+
+    Args:
+        n_threads (int): Number of threads.
+
+    Returns:
+        ThreadPoolExecutor: Pool, created on first use in each process (threads do not survive a fork).
+    """
+
+    key = (os.getpid(), n_threads)
+    if key not in _THREAD_POOLS:
+        _THREAD_POOLS[key] = ThreadPoolExecutor(n_threads)
+    return _THREAD_POOLS[key]
 
 
 def normalize(image: np.ndarray) -> np.ndarray:
@@ -18,6 +42,70 @@ def normalize(image: np.ndarray) -> np.ndarray:
     return (255 * ((image - i_min) / denom)).astype(np.uint8)
 
 
+def normalize_sequence(images: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """Applies normalize to every frame of a sequence at once.
+
+    Args:
+        images (np.ndarray): Image array of shape (T, 1, H, W).
+        out (np.ndarray, optional): uint8 array of the same shape to write into. Defaults to None.
+
+    Returns:
+        np.ndarray: Array with values between 0 and 255, identical to normalizing each frame separately.
+    """
+
+    axes = tuple(range(1, images.ndim))
+    i_min, i_max = images.min(axis=axes, keepdims=True), images.max(axis=axes, keepdims=True)
+    denom = np.where(i_max > i_min, i_max - i_min, 1)
+
+    if out is None:
+        out = np.empty(images.shape, dtype=np.uint8)
+
+    # elementwise work runs over a few frames at a time, so that the float64 buffer stays in cache
+    step = max(1, CHUNK_PIXELS // max(1, images[0].size))
+    for t in range(0, images.shape[0], step):
+        work = np.subtract(images[t: t + step], i_min[t: t + step], dtype=np.float64)  # image >= i_min, so nothing wraps around
+        work /= denom[t: t + step]
+        work *= 255
+        np.copyto(out[t: t + step], work, casting="unsafe")
+
+    return out
+
+
+def raw_depth_preprocess(preprocess_dict: dict) -> dict:
+    """Preprocess spec that resizes frames but keeps their raw depth values.
+
+    Frames loaded with it can be quantized later by quantize_sequence, so that caches of them do not depend on
+    the gvar settings.
+
+    Args:
+        preprocess_dict (dict): Dict containing preprocess specifications.
+
+    Returns:
+        dict: Preprocess dict with only the resize settings and raw_depth set.
+    """
+
+    assert not preprocess_dict.get("offline"), "Offline preprocessed frames are already quantized."
+    return {"resize": preprocess_dict["resize"], "raw_depth": True}
+
+
+def quantize_sequence(image_sequence: np.ndarray, preprocess_dict: dict, out: np.ndarray = None) -> np.ndarray:
+    """Quantizes a sequence of resized raw depth frames to 8 bits, as preprocess_image does per frame.
+
+    Args:
+        image_sequence (np.ndarray): Raw depth frames of shape (T, 1, H, W).
+        preprocess_dict (dict): Dict containing preprocess specifications.
+        out (np.ndarray, optional): uint8 array of the same shape to write into. Defaults to None.
+
+    Returns:
+        np.ndarray: Images of shape (T, 1, H, W), of type uint8.
+    """
+
+    if "gvar" in preprocess_dict:
+        return grayscale_variation_sequence(image_sequence, **preprocess_dict["gvar"], out=out)
+
+    return normalize_sequence(image_sequence, out=out)
+
+
 def get_samples(start: int, end: int, T: int) -> np.ndarray:
     """Samples T frame indices between start and end, inclusive.
 
@@ -35,19 +123,24 @@ def get_samples(start: int, end: int, T: int) -> np.ndarray:
     return samples.astype(np.int32)
 
 
-def load_joints(joint_path: str, frame_idxs: np.ndarray, T: int) -> np.ndarray:
+def load_joints(joint_path: str, frame_idxs: np.ndarray, T: int, store: SkeletonStore = None) -> np.ndarray:
     """Loads joint points.
 
     Args:
         joint_path (str): Path to joint points.
         frame_idxs (np.ndarray): Selected frames.
         T (int): Sequence length.
+        store (SkeletonStore, optional): Binary skeleton store; if given, only the selected rows are read
+            instead of parsing the text file. Defaults to None.
 
     Returns:
         np.ndarray: Sequence of joint points of shape (T, 22 * D).
     """
 
-    joint_points = np.loadtxt(joint_path, dtype=np.float32)[frame_idxs]
+    if store is not None:
+        joint_points = store.read(joint_path, frame_idxs)
+    else:
+        joint_points = np.loadtxt(open_prefetched(joint_path), dtype=np.float32)[frame_idxs]
     
     palm_idx = 1
     num_frames = joint_points.shape[0]
@@ -58,35 +151,132 @@ def load_joints(joint_path: str, frame_idxs: np.ndarray, T: int) -> np.ndarray:
     return joint_points
 
 
-def load_image_sequence(image_dir: str, frame_idxs: np.ndarray, T: int, preprocess_dict: dict, mode: str = "shrec") -> np.ndarray:
+def preprocess_image(image: Image.Image, preprocess_dict: dict) -> np.ndarray:
+    """Resizes a raw depth frame and quantizes it to 8 bits, unless preprocess_dict["raw_depth"] is set.
+
+    Args:
+        image (Image.Image): Raw depth frame, or the array of its depth values.
+        preprocess_dict (dict): Dict containing preprocess specifications.
+
+    Returns:
+        np.ndarray: Image of shape (H_new, W_new), of type uint8 (uint16 if raw_depth is set).
+    """
+
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+
+    H_new, W_new = preprocess_dict["resize"]["H_new"], preprocess_dict["resize"]["W_new"]
+    image = np.array(image.resize((W_new, H_new), Image.LANCZOS))
+
+    if preprocess_dict.get("raw_depth"):
+        return image
+
+    if "gvar" in preprocess_dict:
+        return grayscale_variation(image, **preprocess_dict["gvar"])
+    
+    return normalize(image)
+
+
+def load_image_pyramid(image_dir: str, frame_idxs: np.ndarray, levels: list, file_name: str, n_threads: int = 0, decoder: str = "pil") -> list:
+    """Decodes every frame once and resizes it to several resolutions, keeping raw depth values.
+
+    Args:
+        image_dir (str): Path to image folder.
+        frame_idxs (np.ndarray): Selected frames.
+        levels (list): Resolutions [H, W].
+        file_name (str): Frame file name pattern.
+        n_threads (int, optional): If > 1, frames are decoded concurrently by a shared thread pool. Defaults to 0.
+        decoder (str, optional): Frame decoder, see utils.decode. Defaults to 'pil'.
+
+    Returns:
+        list: One uint16 array of shape (T, 1, H, W) per level, equal to load_image_sequence with raw_depth set
+            and the resolution of that level.
+    """
+
+    pyramid = [np.zeros((len(frame_idxs), 1, H, W), dtype=np.uint16) for H, W in levels]
+    decoder = get_decoder(decoder)
+
+    def load_frame(i, idx):
+        image = Image.fromarray(decoder.read(open_prefetched(os.path.join(image_dir, file_name.format(idx)))))  # decoded once, resized per level
+
+        for image_blocks, (H, W) in zip(pyramid, levels):
+            image_blocks[i, 0, :, :] = preprocess_image(image, {"resize": {"H_new": H, "W_new": W}, "raw_depth": True})
+
+    if n_threads > 1:
+        list(get_thread_pool(n_threads).map(load_frame, range(len(frame_idxs)), frame_idxs))
+    else:
+        for i, idx in enumerate(frame_idxs):
+            load_frame(i, idx)
+
+    return pyramid
+
+
+def load_image_sequence(image_dir: str, frame_idxs: np.ndarray, T: int, preprocess_dict: dict, mode: str = "shrec", n_threads: int = 0, decoder: str = "pil") -> np.ndarray:
     """Loads image sequence and applies necessary processing.
 
+    If preprocess_dict["offline"] is set, frames were already resized and quantized by crop_roi.py and are read
+    as is, either from PNGs ('png') or from one frames.npy array per sequence ('npy'). If preprocess_dict["raw_depth"]
+    is set, frames are only resized and returned as uint16 depth values. If preprocess_dict["pyramid"] is set, a list
+    of such sequences is returned, one per resolution, see load_image_pyramid. With preprocess_dict["resize"]["batched"],
+    all frames of the sequence are resized together by utils.resize.resize_sequence instead of one by one with PIL.
+
     Args:
         image_dir (str): Path to image folder.
         frame_idxs (np.ndarray): Selected frames.
         T (int): Sequence length.
         preprocess_dict (dict): Dict containing preprocess specifications.
+        mode (str, optional): One of 'shrec' or 'dhg'. Defaults to 'shrec'.
+        n_threads (int, optional): If > 1, frames are decoded concurrently by a shared thread pool. Defaults to 0.
+        decoder (str, optional): Frame decoder, see utils.decode; 'npy' reads .npy frames instead of PNGs. Defaults to 'pil'.
 
     Returns:
         np.ndarray: Sequences of images of shape (T, 1, H, W)
     """
     
+    file_name = ("{}_depth" if mode == "shrec" else "depth_{}") + get_decoder(decoder).ext
+    offline = preprocess_dict.get("offline")
+
+    if "pyramid" in preprocess_dict:
+        return load_image_pyramid(image_dir, frame_idxs, preprocess_dict["pyramid"], file_name, n_threads, decoder)
+
     H_new, W_new = preprocess_dict["resize"]["H_new"], preprocess_dict["resize"]["W_new"]
-    image_blocks = np.zeros((len(frame_idxs), 1, H_new, W_new), dtype=np.uint8)
-    file_name = "{}_depth.png" if mode == "shrec" else "depth_{}.png"
-    
-    for i, idx in enumerate(frame_idxs):
-        path = os.path.join(image_dir, file_name.format(idx))
-        image = Image.open(path).resize((W_new, H_new), Image.LANCZOS)
+    image_blocks = np.zeros((len(frame_idxs), 1, H_new, W_new), dtype=np.uint16 if preprocess_dict.get("raw_depth") else np.uint8)
 
-        image = np.array(image)
+    if offline == "npy":
+        frames = np.load(os.path.join(image_dir, "frames.npy"), mmap_mode="r")
+        image_blocks[:, 0] = frames[frame_idxs - (0 if mode == "shrec" else 1)]  # dhg file ids start at 1
+        return image_blocks
 
-        if "gvar" in preprocess_dict:
-            image = grayscale_variation(image, **preprocess_dict["gvar"])
+    # frames are resized into a raw depth block and quantized together once all of them are loaded
+    raw_blocks = image_blocks if offline or preprocess_dict.get("raw_depth") else np.zeros(image_blocks.shape, dtype=np.uint16)
+    resize_dict = {"resize": preprocess_dict["resize"], "raw_depth": True}
+    batched = not offline and preprocess_dict["resize"].get("batched", False)
+    decoder = get_decoder(decoder)
 
+    def load_frame(i, idx):
+        path = os.path.join(image_dir, file_name.format(idx))
+        image = decoder.read(open_prefetched(path))
+
+        if offline == "png":
+            image_blocks[i, 0, :, :] = image
+        elif batched:
+            return image  # resized with the rest of the sequence
         else:
-            image = normalize(image)
+            raw_blocks[i, 0, :, :] = preprocess_image(image, resize_dict)
+
+    if n_threads > 1:
+        # PIL and OpenCV release the GIL while decoding and resizing
+        frames = list(get_thread_pool(n_threads).map(load_frame, range(len(frame_idxs)), frame_idxs))
+    else:
+        frames = [load_frame(i, idx) for i, idx in enumerate(frame_idxs)]
+
+    if batched:
+        # one batch per frame shape, usually a single one
+        for shape in set(frame.shape for frame in frames):
+            ids = [i for i, frame in enumerate(frames) if frame.shape == shape]
+            raw_blocks[ids, 0] = resize_sequence(np.stack([frames[i] for i in ids]), H_new, W_new)
 
-        image_blocks[i, 0, :, :] = image
+    if raw_blocks is not image_blocks:
+        quantize_sequence(raw_blocks, preprocess_dict, out=image_blocks)
 
-    return image_blocks
\ No newline at end of file
+    return image_blocks
@@ -74,9 +74,12 @@ def log(log_dict: dict, step: int, config: dict) -> None:
     print(log_message)
 
 
-def get_model(model_config):
+def get_model(model_config, preprocess_dict=None):
+    # with quantize_in_model the model takes raw resized depth and applies preprocess_dict itself
+    preprocess = preprocess_dict if model_config.get("quantize_in_model") else None
+
     if model_config["name"] is not None:
-        model = model_from_name(model_config["name"], model_config["num_classes"])
+        model = model_from_name(model_config["name"], model_config["num_classes"], preprocess)
     else:
         if model_config["type"] == "feature_fusion":
             fusion_model = FeatureFusionNet
@@ -84,7 +87,7 @@ def get_model(model_config):
             fusion_model = ScoreFusionNet
         else:
             raise ValueError(f"Invalid model_name {model_config['name']}.")
-        model = fusion_model(**model_config)
+        model = fusion_model(**model_config, preprocess=preprocess)
 
     return model
 
@@ -0,0 +1,222 @@
+"""Sharded, memory-mapped storage for preprocessed sequences."""
+
+import numpy as np
+import os
+import json
+
+
+INDEX_FILE = "index.npz"
+META_FILE = "meta.json"
+
+
+def shard_path(root: str, kind: str, shard: int) -> str:
+    """Path of a shard file.
+
+    Args:
+        root (str): Packed dataset directory.
+        kind (str): One of 'image' or 'joint'.
+        shard (int): Shard id.
+
+    Returns:
+        str: Path to shard file.
+    """
+    return os.path.join(root, f"{kind}_{shard:03d}.bin")
+
+
+def pyramid_level(root: str, res: tuple) -> str:
+    """Directory of one resolution of a pyramid store written by pack_dataset.py --format pyramid.
+
+    Every level is a packed dataset of resized uint16 depth frames, quantized per sample.
+
+    Args:
+        root (str): Pyramid store directory.
+        res (tuple): Resolution (H, W).
+
+    Returns:
+        str: Packed dataset directory of the level.
+    """
+
+    path = os.path.join(root, "{}x{}".format(*res))
+    assert os.path.isdir(path), f"Pyramid store {root} has no {res[0]}x{res[1]} level, available: {sorted(os.listdir(root))}."
+    return path
+
+
+class PackedWriter:
+    """Appends sequences to large binary shards and records their offsets."""
+
+    def __init__(self, root: str, shard_bytes: int = 1 << 30, image_dtype: np.dtype = np.uint8):
+        os.makedirs(root, exist_ok=True)
+
+        self.root = root
+        self.shard_bytes = shard_bytes
+        self.image_dtype = np.dtype(image_dtype)
+        self.shard = -1
+        self.files = {}
+        self.offsets = {"image": 0, "joint": 0}
+        self.index = {"rows": [], "shard": [], "image_offset": [], "joint_offset": [], "lengths": []}
+        self.shapes = None
+
+    def _next_shard(self):
+        for f in self.files.values():
+            f.close()
+
+        self.shard += 1
+        self.files = {kind: open(shard_path(self.root, kind, self.shard), "wb") for kind in ("image", "joint")}
+        self.offsets = {"image": 0, "joint": 0}
+
+    def add(self, data_row: np.ndarray, joint_points: np.ndarray, image_sequence: np.ndarray) -> None:
+        """Appends a single sequence.
+
+        Args:
+            data_row (np.ndarray): Data list row identifying the sequence.
+            joint_points (np.ndarray): Joint points of shape (T', 22 * D).
+            image_sequence (np.ndarray): Image sequence of shape (T', 1, H, W).
+        """
+
+        joint_points = np.ascontiguousarray(joint_points, dtype=np.float32)
+        image_sequence = np.ascontiguousarray(image_sequence, dtype=self.image_dtype)
+
+        if self.shapes is None:
+            self.shapes = {"image": image_sequence.shape[1:], "joint": joint_points.shape[1:]}
+
+        if self.shard < 0 or self.offsets["image"] * self.image_dtype.itemsize + image_sequence.nbytes > self.shard_bytes:
+            self._next_shard()
+
+        self.index["rows"].append(np.asarray(data_row, dtype=np.int64))
+        self.index["shard"].append(self.shard)
+        self.index["image_offset"].append(self.offsets["image"])
+        self.index["joint_offset"].append(self.offsets["joint"])
+        self.index["lengths"].append(joint_points.shape[0])
+
+        for kind, arr in (("image", image_sequence), ("joint", joint_points)):
+            self.files[kind].write(arr.tobytes())
+            self.offsets[kind] += arr.size  # in elements
+
+    def close(self, meta: dict) -> None:
+        """Flushes shards and writes the offset index.
+
+        Args:
+            meta (dict): Settings used to produce the data (T, D, preprocess, ...).
+        """
+
+        for f in self.files.values():
+            f.close()
+
+        np.savez(
+            os.path.join(self.root, INDEX_FILE),
+            **{k: np.stack(v) if k == "rows" else np.array(v, dtype=np.int64) for k, v in self.index.items()}
+        )
+
+        meta = dict(meta, n_shards=self.shard + 1, image_shape=list(self.shapes["image"]), joint_shape=list(self.shapes["joint"]), image_dtype=self.image_dtype.str)
+        with open(os.path.join(self.root, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+
+
+class _PackedField:
+    """Indexable view over one field ('image' or 'joint') of a packed store."""
+
+    def __init__(self, store, kind: str):
+        self.store = store
+        self.kind = kind
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, key) -> np.ndarray:
+        if isinstance(key, tuple):  # e.g. store["image"][c_idx, :n]
+            return self.store.read(self.kind, key[0])[key[1:]]
+        return self.store.read(self.kind, key)
+
+
+class PackedStore:
+    """Read-only access to a packed dataset through np.memmap.
+
+    Behaves like the in-memory cache dict, i.e. `store["joint"][c_idx, :n]`, `store["image"][c_idx, :n]` and `store["lengths"]`.
+    Shards are mapped lazily once per process, so serving a sample does not open any file.
+    """
+
+    def __init__(self, root: str, data_list: np.ndarray = None):
+        """
+        Args:
+            root (str): Packed dataset directory.
+            data_list (np.ndarray, optional): Data list rows; if given, the store is reordered so that
+                position i refers to data_list[i]. Defaults to None.
+        """
+
+        self.root = root
+
+        with open(os.path.join(root, META_FILE), "r") as f:
+            self.meta = json.load(f)
+
+        with np.load(os.path.join(root, INDEX_FILE)) as index:
+            self.index = {k: index[k] for k in index.files}
+
+        if data_list is not None:
+            rows = self.lookup(data_list)
+            self.index = {k: v[rows] for k, v in self.index.items()}
+
+        self.image_shape = tuple(self.meta["image_shape"])
+        self.joint_shape = tuple(self.meta["joint_shape"])
+        self._maps = {}
+
+    def __len__(self):
+        return self.index["lengths"].shape[0]
+
+    def __getitem__(self, kind: str):
+        assert kind in ["image", "joint", "lengths"], f"Invalid field {kind}."
+        return self.index["lengths"] if kind == "lengths" else _PackedField(self, kind)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_maps"] = {}  # memmaps are re-opened in each worker process
+        return state
+
+    def lookup(self, data_list: np.ndarray) -> np.ndarray:
+        """Finds the store position of each data list row.
+
+        Args:
+            data_list (np.ndarray): Data list rows.
+
+        Returns:
+            np.ndarray: Store positions.
+        """
+
+        n_cols = self.index["rows"].shape[1]
+        positions = {tuple(row): i for i, row in enumerate(self.index["rows"].tolist())}
+
+        rows = []
+        for row in np.asarray(data_list)[:, :n_cols].tolist():
+            assert tuple(row) in positions, f"Sequence {row} not found in packed dataset {self.root}."
+            rows.append(positions[tuple(row)])
+
+        return np.array(rows, dtype=np.int64)
+
+    def check(self, T: int, D: int, preprocess_dict: dict) -> None:
+        """Asserts that the store was packed with the given settings."""
+
+        assert self.meta["T"] == T and self.meta["D"] == D, f"Packed dataset {self.root} was built with T={self.meta['T']}, D={self.meta['D']}."
+        assert self.meta["preprocess"] == preprocess_dict, f"Packed dataset {self.root} was built with preprocess={self.meta['preprocess']}."
+
+    def _map(self, kind: str, shard: int) -> np.memmap:
+        if (kind, shard) not in self._maps:
+            dtype = np.dtype(self.meta.get("image_dtype", "|u1")) if kind == "image" else np.float32
+            self._maps[(kind, shard)] = np.memmap(shard_path(self.root, kind, shard), dtype=dtype, mode="r")
+        return self._maps[(kind, shard)]
+
+    def read(self, kind: str, i: int) -> np.ndarray:
+        """Reads one field of a sequence.
+
+        Args:
+            kind (str): One of 'image' or 'joint'.
+            i (int): Store position.
+
+        Returns:
+            np.ndarray: Read-only array of shape (T', 1, H, W) or (T', 22 * D).
+        """
+
+        shape = self.image_shape if kind == "image" else self.joint_shape
+        length = self.index["lengths"][i]
+        offset = self.index[f"{kind}_offset"][i]
+        data = self._map(kind, self.index["shard"][i])
+
+        return data[offset: offset + length * int(np.prod(shape))].reshape(length, *shape)
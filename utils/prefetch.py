@@ -0,0 +1,139 @@
+"""Sampler-aware read-ahead of the raw files of upcoming data items."""
+
+from torch.utils.data import Sampler
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import io
+import os
+
+
+_BUFFER = None
+
+
+class ReadAheadBuffer:
+    """Byte-bounded store of file contents read ahead of use."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.data = {}
+        self.consumed = set()  # paths already read from disk, whose late read-ahead nobody would pop
+        self.lock = threading.Lock()
+
+    def put(self, path: str, data: bytes) -> bool:
+        """Stores the contents of a file, unless it was already used or the byte budget is exhausted.
+
+        Newer reads are needed later than everything already buffered, so they are the ones dropped.
+        """
+
+        with self.lock:
+            if path in self.data or path in self.consumed or self.size + len(data) > self.max_bytes:
+                return False
+            self.data[path] = data
+            self.size += len(data)
+            return True
+
+    def pop(self, path: str) -> bytes:
+        """Removes and returns the contents of a file, None if they were not read ahead (yet)."""
+
+        with self.lock:
+            data = self.data.pop(path, None)
+            if data is not None:
+                self.size -= len(data)
+            else:
+                self.consumed.add(path)
+            return data
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+            self.consumed.clear()
+            self.size = 0
+
+
+def open_prefetched(path: str):
+    """Returns an in-memory file if the contents of path were read ahead, else path itself.
+
+    Args:
+        path (str): File path.
+
+    Returns:
+        io.BytesIO or str: Object accepted by Image.open and np.loadtxt.
+    """
+
+    if _BUFFER is not None:
+        data = _BUFFER.pop(path)
+        if data is not None:
+            return io.BytesIO(data)
+    return path
+
+
+def read_ahead(paths: list, buffer: ReadAheadBuffer = None) -> None:
+    """Reads files into buffer, or only asks the OS to load them into the page cache if buffer is None."""
+
+    for path in paths:
+        try:
+            if buffer is not None:
+                with open(path, "rb") as f:
+                    buffer.put(path, f.read())
+            else:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                finally:
+                    os.close(fd)
+        except OSError:
+            pass  # the actual load reports missing files
+
+
+class ReadAheadSampler(Sampler):
+    """Wraps a sampler and reads the files of the next `depth` data items while they wait for their turn.
+
+    With num_workers == 0 the file contents are kept in memory (up to max_bytes) and picked up by
+    load_image_sequence/load_joints through open_prefetched. With worker processes, reads are issued as
+    page cache read-ahead instead, which the workers then hit.
+    """
+
+    def __init__(self, sampler: Sampler, dataset, depth: int = 8, max_bytes: int = 256 << 20, n_threads: int = 4, keep: bool = True):
+        """
+        Args:
+            sampler (Sampler): Sampler defining the index order.
+            dataset: Dataset implementing source_files(idx).
+            depth (int, optional): Number of data items read ahead. Defaults to 8.
+            max_bytes (int, optional): Memory budget for kept file contents. Defaults to 256 MiB.
+            n_threads (int, optional): Number of reader threads. Defaults to 4.
+            keep (bool, optional): Keep contents in memory; only valid if the dataset is read in this process. Defaults to True.
+        """
+
+        self.sampler = sampler
+        self.dataset = dataset
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.n_threads = n_threads
+        self.keep = keep
+        self.pool = None
+
+    def __len__(self):
+        return len(self.sampler)
+
+    def __iter__(self):
+        global _BUFFER
+
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.n_threads)
+
+        buffer = None
+        if self.keep:
+            if _BUFFER is None:
+                _BUFFER = ReadAheadBuffer(self.max_bytes)
+            buffer = _BUFFER
+            buffer.clear()  # drop leftovers of an interrupted epoch
+
+        order = list(self.sampler)
+        n_submitted = 0
+
+        for k, idx in enumerate(order):
+            while n_submitted < min(len(order), k + 1 + self.depth):
+                self.pool.submit(read_ahead, self.dataset.source_files(order[n_submitted]), buffer)
+                n_submitted += 1
+            yield idx
@@ -0,0 +1,130 @@
+"""Batched Lanczos resizing of frame stacks."""
+
+import numpy as np
+from typing import Tuple
+
+
+_MATRICES = {}
+
+
+def _lanczos(x: np.ndarray) -> np.ndarray:
+    """Lanczos kernel with support 3, as used by PIL."""
+    return np.where(np.abs(x) < 3, np.sinc(x) * np.sinc(x / 3), 0)
+
+
+def resample_matrix(in_size: int, out_size: int) -> np.ndarray:
+    """Lanczos resampling weights along one axis, computed like PIL's precompute_coeffs.
+
+    Args:
+        in_size (int): Input length.
+        out_size (int): Output length.
+
+    Returns:
+        np.ndarray: float64 matrix of shape (out_size, in_size); row i holds the normalized weights of output pixel i.
+    """
+
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = 3.0 * filterscale
+
+    weights = np.zeros((out_size, in_size), dtype=np.float64)
+    for i in range(out_size):
+        center = (i + 0.5) * scale
+        x_min = max(int(center - support + 0.5), 0)
+        x_max = min(int(center + support + 0.5), in_size)
+
+        w = _lanczos((np.arange(x_min, x_max) - center + 0.5) / filterscale)
+        total = w.sum()
+        weights[i, x_min: x_max] = w / total if total else w
+
+    return weights
+
+
+def _blocks(weights: np.ndarray, block_size: int, dtype: np.dtype) -> list:
+    """Splits a banded resampling matrix into groups of output pixels and the input range each group reads."""
+
+    blocks = []
+    for start in range(0, weights.shape[0], block_size):
+        rows = weights[start: start + block_size]
+        cols = np.flatnonzero(np.any(rows != 0, axis=0))
+        in_start, in_end = (cols[0], cols[-1] + 1) if len(cols) else (0, 0)
+        blocks.append((slice(start, start + rows.shape[0]), slice(in_start, in_end), np.ascontiguousarray(rows[:, in_start: in_end], dtype=dtype)))
+    return blocks
+
+
+def get_resample_matrices(in_shape: Tuple[int, int], out_shape: Tuple[int, int], dtype: np.dtype = np.float32, block_size: int = 16) -> Tuple[list, list]:
+    """Vertical and horizontal resampling matrices, cached per input and output shape.
+
+    The kernel only covers a few input pixels per output pixel, so each matrix is stored as blocks of block_size
+    output pixels together with the input range they read, which skips most of the zeros of the dense matrix.
+
+    Args:
+        in_shape (tuple): Input shape (H, W).
+        out_shape (tuple): Output shape (H_new, W_new).
+        dtype (np.dtype, optional): Weight dtype. Defaults to np.float32.
+        block_size (int, optional): Output pixels per block. Defaults to 16.
+
+    Returns:
+        tuple: Lists of (output slice, input slice, weights) blocks; vertical weights are of shape (rows, inputs),
+            horizontal ones (inputs, columns).
+    """
+
+    key = (tuple(in_shape), tuple(out_shape), np.dtype(dtype).str, block_size)
+    if key not in _MATRICES:
+        vertical = _blocks(resample_matrix(in_shape[0], out_shape[0]), block_size, dtype)
+        horizontal = [(o, i, np.ascontiguousarray(w.T)) for o, i, w in _blocks(resample_matrix(in_shape[1], out_shape[1]), block_size, dtype)]
+        _MATRICES[key] = (vertical, horizontal)
+    return _MATRICES[key]
+
+
+def _round_clip(x: np.ndarray, max_value: int) -> np.ndarray:
+    """Rounds half away from zero and clips to [0, max_value] in place, like PIL does after each pass."""
+
+    np.clip(x, 0, max_value, out=x)
+    x += 0.5
+    return np.floor(x, out=x)
+
+
+def resize_sequence(frames: np.ndarray, H_new: int, W_new: int, out: np.ndarray = None, dtype: np.dtype = np.float32) -> np.ndarray:
+    """Lanczos-resizes a stack of 16-bit depth frames with batched matrix products.
+
+    The kernel weights only depend on the frame shape, so the separable resampling matrices are built once per
+    shape and every frame of the stack is resized by the same horizontal and vertical products (one per block of
+    output pixels, see get_resample_matrices). Like PIL, the horizontal pass runs first and both passes are
+    rounded and clipped to the 16-bit range. The result agrees with `Image.resize((W_new, H_new), Image.LANCZOS)`
+    on each frame up to +-1 depth unit: in float32 about 0.1% of the pixels of full-range 16-bit noise are off by
+    one, in float64 (slower) only the summation order differs and mismatches are in the order of 1e-5.
+
+    Args:
+        frames (np.ndarray): Frames of shape (T, H, W), of an integer type within the uint16 range.
+        H_new (int): Output height.
+        W_new (int): Output width.
+        out (np.ndarray, optional): uint16 array of shape (T, H_new, W_new) to write into. Defaults to None.
+        dtype (np.dtype, optional): Precision of the products. Defaults to np.float32.
+
+    Returns:
+        np.ndarray: Resized frames of shape (T, H_new, W_new), of type uint16.
+    """
+
+    T, H, W = frames.shape
+    vertical, horizontal = get_resample_matrices((H, W), (H_new, W_new), dtype)
+
+    if out is None:
+        out = np.empty((T, H_new, W_new), dtype=np.uint16)
+
+    work = frames.astype(dtype)
+
+    if W_new != W:
+        resized = np.empty((T, H, W_new), dtype=dtype)
+        for o, i, weights in horizontal:
+            np.matmul(work[:, :, i], weights, out=resized[:, :, o])
+        work = _round_clip(resized, 65535)
+
+    if H_new != H:
+        resized = np.empty((T, H_new, work.shape[2]), dtype=dtype)
+        for o, i, weights in vertical:
+            np.matmul(weights, work[:, i], out=resized[:, o])
+        work = _round_clip(resized, 65535)
+
+    np.copyto(out, work, casting="unsafe")
+    return out
@@ -0,0 +1,148 @@
+"""Indexed binary store replacing the per-sequence skeleton text files."""
+
+import numpy as np
+import os
+
+
+_STORES = {}
+
+
+def store_paths(base_dir: str, file_name: str):
+    """Paths of the data and index files of a skeleton store.
+
+    Args:
+        base_dir (str): Data root.
+        file_name (str): Skeleton text file name, e.g. 'skeleton_image.txt'.
+
+    Returns:
+        str: Path to binary data file.
+        str: Path to index file.
+    """
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(base_dir, f"{stem}.bin"), os.path.join(base_dir, f"{stem}_index.npz")
+
+
+def write_skeleton_store(base_dir: str, file_name: str, seq_dirs: list, skeletons) -> None:
+    """Writes all skeleton arrays of a dataset into one float32 file plus a row offset index.
+
+    Args:
+        base_dir (str): Data root.
+        file_name (str): Skeleton text file name.
+        seq_dirs (list): Sequence directories, relative to base_dir.
+        skeletons (Iterable[np.ndarray]): Skeleton array of each sequence, of shape (num_frames, 22 * D).
+    """
+
+    data_path, index_path = store_paths(base_dir, file_name)
+    offsets, n_rows, n_cols = [], [], None
+
+    with open(data_path + ".tmp", "wb") as f:
+        offset = 0
+        for joint_points in skeletons:
+            joint_points = np.ascontiguousarray(joint_points, dtype=np.float32).reshape(-1, joint_points.shape[-1])
+            n_cols = joint_points.shape[1]
+            f.write(joint_points.tobytes())
+
+            offsets.append(offset)
+            n_rows.append(joint_points.shape[0])
+            offset += joint_points.shape[0]
+
+    os.replace(data_path + ".tmp", data_path)
+
+    # the index is written last and atomically, stores without a complete index are not used
+    with open(index_path + ".tmp", "wb") as f:
+        np.savez(
+            f,
+            seq_dirs=np.array([os.path.normpath(d) for d in seq_dirs]),
+            offsets=np.array(offsets, dtype=np.int64),
+            n_rows=np.array(n_rows, dtype=np.int64),
+            n_cols=n_cols,
+            sources=np.array([source_stat(os.path.join(base_dir, d, file_name)) for d in seq_dirs], dtype=np.int64).reshape(-1, 2)
+        )
+    os.replace(index_path + ".tmp", index_path)
+
+
+def source_stat(path: str) -> tuple:
+    """(mtime in ns, size) of a skeleton text file, (-1, -1) if it does not exist."""
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return -1, -1
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SkeletonStore:
+    """Reads skeleton rows by offset from a memory-mapped binary store."""
+
+    def __init__(self, base_dir: str, file_name: str):
+        data_path, index_path = store_paths(base_dir, file_name)
+
+        with np.load(index_path) as index:
+            self.rows = {d: (o, n) for d, o, n in zip(index["seq_dirs"].tolist(), index["offsets"].tolist(), index["n_rows"].tolist())}
+            n_cols = int(index["n_cols"])
+            self.sources = dict(zip(index["seq_dirs"].tolist(), map(tuple, index["sources"].tolist()))) if "sources" in index else None
+
+        self.base_dir = base_dir
+        self.file_name = file_name
+        self.data = np.memmap(data_path, dtype=np.float32, mode="r").reshape(-1, n_cols)
+
+    def stale(self) -> list:
+        """Sequence directories whose text file changed since the store was written.
+
+        Text files that no longer exist are served from the store. Stores written without source stats are
+        entirely stale.
+        """
+
+        if self.sources is None:
+            return list(self.rows)
+
+        stale = []
+        for seq_dir, stored in self.sources.items():
+            current = source_stat(os.path.join(self.base_dir, seq_dir, self.file_name))
+            if current != (-1, -1) and current != stored:
+                stale.append(seq_dir)
+        return stale
+
+    def read(self, joint_path: str, frame_idxs: np.ndarray) -> np.ndarray:
+        """Reads selected frames of a skeleton file.
+
+        Args:
+            joint_path (str): Path to the original skeleton text file.
+            frame_idxs (np.ndarray): Selected frames.
+
+        Returns:
+            np.ndarray: Array of shape (len(frame_idxs), 22 * D), same as np.loadtxt(joint_path)[frame_idxs].
+        """
+
+        seq_dir = os.path.normpath(os.path.relpath(os.path.dirname(joint_path), self.base_dir))
+        offset, n_rows = self.rows[seq_dir]
+
+        if len(frame_idxs) and (frame_idxs.max() >= n_rows or frame_idxs.min() < -n_rows):
+            raise IndexError(f"Frame index out of bounds for {joint_path} with {n_rows} frames.")
+
+        return np.asarray(self.data[offset + frame_idxs % n_rows])
+
+
+def get_skeleton_store(base_dir: str, file_name: str) -> SkeletonStore:
+    """Opens the skeleton store of a dataset once per process.
+
+    Args:
+        base_dir (str): Data root.
+        file_name (str): Skeleton text file name.
+
+    Returns:
+        SkeletonStore: Store, or None if the dataset was not converted with pack_skeletons.py or if the text files
+            changed since; the text files are then parsed instead.
+    """
+
+    key = (os.path.abspath(base_dir), file_name)
+    if key not in _STORES:
+        store = None
+        if os.path.exists(store_paths(base_dir, file_name)[1]):
+            store = SkeletonStore(base_dir, file_name)
+            stale = store.stale()
+            if stale:
+                print(f"Skeleton store of {file_name} is outdated for {len(stale)} sequences (e.g. {stale[0]}), reading the text files; rerun pack_skeletons.py.")
+                store = None
+        _STORES[key] = store
+    return _STORES[key]
@@ -0,0 +1,223 @@
+"""Tar shard format and streaming dataset for sequential reads."""
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from utils.augment import apply_augs
+import tarfile
+import json
+import io
+import os
+
+
+INDEX_FILE = "index.json"
+
+
+def _npy_bytes(arr: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, arr)
+    return buf.getvalue()
+
+
+class TarShardWriter:
+    """Writes sequences (row, joints, frames) into tar shards of bounded size."""
+
+    def __init__(self, root: str, shard_bytes: int = 1 << 30):
+        os.makedirs(root, exist_ok=True)
+
+        self.root = root
+        self.shard_bytes = shard_bytes
+        self.tar = None
+        self.shards = []
+        self.size = 0
+
+    def _next_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+
+        name = f"shard_{len(self.shards):05d}.tar"
+        self.tar = tarfile.open(os.path.join(self.root, name), "w")
+        self.shards.append({"name": name, "rows": []})
+        self.size = 0
+
+    def add(self, data_row: np.ndarray, joint_points: np.ndarray, image_sequence: np.ndarray) -> None:
+        """Appends a single sequence.
+
+        Args:
+            data_row (np.ndarray): Data list row identifying the sequence, labels are derived from it.
+            joint_points (np.ndarray): Joint points of shape (T', 22 * D).
+            image_sequence (np.ndarray): Image sequence of shape (T', 1, H, W).
+        """
+
+        data_row = np.asarray(data_row, dtype=np.int64)
+        members = {"row": data_row, "joint": joint_points.astype(np.float32), "image": image_sequence.astype(np.uint8)}
+        nbytes = sum(arr.nbytes for arr in members.values())
+
+        if self.tar is None or self.size + nbytes > self.shard_bytes:
+            self._next_shard()
+
+        key = "_".join(map(str, data_row[:4]))
+        for field, arr in members.items():
+            data = _npy_bytes(arr)
+            info = tarfile.TarInfo(f"{key}.{field}.npy")
+            info.size = len(data)
+            self.tar.addfile(info, io.BytesIO(data))
+
+        self.shards[-1]["rows"].append(data_row.tolist())
+        self.size += nbytes
+
+    def close(self, meta: dict) -> None:
+        """Closes the last shard and writes the shard index.
+
+        Args:
+            meta (dict): Settings used to produce the data (mode, T, D, preprocess, ...).
+        """
+
+        if self.tar is not None:
+            self.tar.close()
+
+        with open(os.path.join(self.root, INDEX_FILE), "w") as f:
+            json.dump(dict(meta, shards=self.shards), f)
+
+
+def iter_tar_shard(path: str):
+    """Reads a shard front to back.
+
+    Args:
+        path (str): Path to tar shard.
+
+    Yields:
+        dict: Sample with "row", "joint" and "image" arrays.
+    """
+
+    sample, key = {}, None
+
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            member_key, field, _ = member.name.rsplit(".", 2)
+
+            if key is not None and member_key != key:
+                yield sample
+                sample = {}
+
+            key = member_key
+            sample[field] = np.load(io.BytesIO(tar.extractfile(member).read()))
+
+    if sample:
+        yield sample
+
+
+class StreamingDataset(IterableDataset):
+    """Streams sequences from tar shards.
+
+    Shards are shuffled every epoch and split across DataLoader workers, each worker reads its shards
+    sequentially through a bounded shuffle buffer.
+    """
+
+    def __init__(self, root: str, data_list: np.ndarray, T: int, num_classes: int, transform_dict: dict, train: bool = True, shuffle_buffer: int = 256, seed: int = 0):
+        """
+        Args:
+            root (str): Tar shard directory, written by pack_dataset.py --format tar.
+            data_list (np.ndarray): Data list rows to use; all other sequences in the shards are skipped.
+            T (int): Sequence length.
+            num_classes (int): Number of classes, 14 or 28.
+            transform_dict (dict): Dict containing preprocess and augmentation specifications.
+            train (bool, optional): Shuffle and augment. Defaults to True.
+            shuffle_buffer (int, optional): Number of samples held in memory for shuffling. Defaults to 256.
+            seed (int, optional): Base seed for shard shuffling. Defaults to 0.
+        """
+
+        super().__init__()
+
+        assert num_classes in [14, 28], "Invalid number of classes."
+
+        with open(os.path.join(root, INDEX_FILE), "r") as f:
+            index = json.load(f)
+
+        n_cols = len(index["shards"][0]["rows"][0])
+        self.rows = {tuple(row) for row in np.asarray(data_list)[:, :n_cols].astype(int).tolist()}
+
+        # only keep shards holding selected sequences
+        self.shards = [os.path.join(root, s["name"]) for s in index["shards"] if any(tuple(r) in self.rows for r in s["rows"])]
+        self.length = sum(tuple(r) in self.rows for s in index["shards"] for r in s["rows"])
+
+        self.root = root
+        self.meta = {k: v for k, v in index.items() if k != "shards"}
+        self.mode = index["mode"]
+        self.T = T
+        self.num_classes = num_classes
+        self.transform_dict = transform_dict
+        self.train = train
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return self.length
+
+    def check(self, T: int, D: int, preprocess_dict: dict) -> None:
+        """Asserts that the shards were written with the given settings, as PackedStore.check."""
+
+        assert self.meta["T"] == T and self.meta["D"] == D, f"Tar shards {self.root} were built with T={self.meta['T']}, D={self.meta['D']}."
+        assert self.meta["preprocess"] == preprocess_dict, f"Tar shards {self.root} were built with preprocess={self.meta['preprocess']}."
+
+    def get_label(self, data_row: np.ndarray) -> int:
+        if self.mode == "shrec":
+            return data_row[4] - 1 if self.num_classes == 14 else data_row[5] - 1
+
+        gesture, finger = data_row[:2]
+        return gesture - 1 if self.num_classes == 14 else 2 * (gesture - 1) + (finger - 1)
+
+    def process(self, sample: dict):
+        joint_points, image_sequence = sample["joint"], sample["image"]
+
+        if self.train and self.transform_dict["aug"] is not None:
+            joint_points, image_sequence = apply_augs(joint_points, image_sequence, self.transform_dict["aug"])
+
+        # bring values to 0-1 range & make float32
+        joint_points = joint_points.astype(np.float32)
+        image_sequence = (image_sequence / 255).astype(np.float32)
+
+        num_frames = joint_points.shape[0]
+
+        if num_frames < self.T:
+            joint_points = np.pad(joint_points, ((0, self.T - num_frames), (0, 0)), mode='constant')
+            image_sequence = np.pad(image_sequence, ((0, self.T - num_frames), (0, 0), (0, 0), (0, 0)), mode="constant")
+
+        return (
+            torch.from_numpy(joint_points),
+            torch.from_numpy(image_sequence),
+            int(self.get_label(sample["row"]))
+        )
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+
+        # all workers must agree on the shard order: the torch base seed differs per epoch but not per worker
+        shard_rng = np.random.default_rng([self.seed, torch.initial_seed() - worker_id, self.epoch])
+        rng = np.random.default_rng([self.seed, torch.initial_seed(), self.epoch, worker_id])
+        self.epoch += 1
+
+        shards = [self.shards[i] for i in shard_rng.permutation(len(self.shards))] if self.train else self.shards
+        shards = shards[worker_id::num_workers]
+
+        buffer = []
+        for shard in shards:
+            for sample in iter_tar_shard(shard):
+                if tuple(sample["row"].tolist()) not in self.rows:
+                    continue
+
+                if not self.train:
+                    yield self.process(sample)
+                    continue
+
+                buffer.append(sample)
+                if len(buffer) >= self.shuffle_buffer:
+                    i = rng.integers(len(buffer))
+                    buffer[i], buffer[-1] = buffer[-1], buffer[i]
+                    yield self.process(buffer.pop())
+
+        rng.shuffle(buffer)
+        for sample in buffer:
+            yield self.process(sample)
@@ -4,6 +4,8 @@ from torch import nn, optim
 from typing import Callable, Tuple
 from torch.utils.data import DataLoader
 from utils.misc import log, calc_step, save_model
+from utils.cache import OnDemandCache
+from utils.batch_augment import apply_batch_augs
 import os
 import time
 from tqdm import tqdm
@@ -133,6 +135,10 @@ def train(net: nn.Module, optimizer: optim.Optimizer, criterion: Callable, train
     n_batches = len(trainloader)
     device = config["hparams"]["device"]
     log_file = os.path.join(config["exp"]["save_dir"], "training_log.txt")
+
+    # augmentation of collated batches instead of per sample in the loader workers
+    batch_augs = config["hparams"]["transforms"].get("batch_aug")
+    assert batch_augs is None or config["hparams"]["transforms"]["aug"] is None, "Use either transforms.aug or transforms.batch_aug."
     
     ############################
     # start training
@@ -144,6 +150,11 @@ def train(net: nn.Module, optimizer: optim.Optimizer, criterion: Callable, train
         running_loss = 0.0
         correct = 0
 
+        # cache stats of the training epoch only; on DHG validation reads the same cache
+        train_cache = getattr(trainloader.dataset, "cache", None)
+        if isinstance(train_cache, OnDemandCache):
+            train_cache.reset_stats()
+
         for batch_index, (joints, images, targets) in enumerate(trainloader):
             step = calc_step(epoch, n_batches, batch_index)
 
@@ -155,6 +166,9 @@ def train(net: nn.Module, optimizer: optim.Optimizer, criterion: Callable, train
             elif schedulers["scheduler"] is not None and epoch > config["hparams"]["scheduler"]["n_warmup"]:
                 schedulers["scheduler"].step()
 
+            if batch_augs is not None:
+                joints, images = apply_batch_augs(joints.to(device), images.to(device), batch_augs)
+
             ####################
             # optimization step
             ####################
@@ -170,6 +184,10 @@ def train(net: nn.Module, optimizer: optim.Optimizer, criterion: Callable, train
         # epoch complete
         #######################
         log_dict = {"epoch": epoch, "time_per_epoch": time.time() - t0, "train_acc": correct/(len(trainloader.dataset)), "avg_loss_per_ep": running_loss/len(trainloader)}
+
+        if isinstance(train_cache, OnDemandCache):
+            log_dict.update(train_cache.stats())
+
         log(log_dict, step, config)
 
         if not epoch % config["exp"]["val_freq"] or epoch == config["hparams"]["n_epochs"]: